@@ -0,0 +1,92 @@
+"""
+Measure building, incrementally updating and querying the memory-mapped index against a full rescan.
+
+A synthetic project is generated, indexed once, then a few files are edited and the index is updated;
+queries open the index file fresh each time, as an IDE plugin or dashboard would.
+
+    python benchmarks/bench_index.py [--files 20000] [--changed 20] [--queries 200]
+
+測量內存映射索引的建立、增量更新與查詢耗時，並與完整重新掃描比較。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_privacy_info import PrivacyIndex, Scanner, ScanOptions, collect_hits, update_index  # noqa: E402
+
+LINES = [
+    "let value = compute(first: 1, second: 2)\n",
+    "let defaults = UserDefaults.standard\n",
+    "let date = attributes.creationDate\n",
+    "let capacity = values.volumeAvailableCapacityKey\n",
+    "let uptime = ProcessInfo.processInfo.systemUptime\n",
+]
+
+
+def make_project(root, files, rng):
+    paths = []
+    for i in range(files):
+        directory = os.path.join(root, "Sources", f"Module{i % 100}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"File{i}.swift")
+        with open(path, "w") as f:
+            f.write("import Alamofire\n" if i % 7 == 0 else "import Foundation\n")
+            f.writelines(rng.choice(LINES) if rng.random() < 0.05 else LINES[0] for _ in range(60))
+            f.write(f"// {i}\n")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--changed", type=int, default=20, help="files edited before the incremental update")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    options = ScanOptions(pod_cache=False)
+    with tempfile.TemporaryDirectory() as root, Scanner() as scanner:
+        paths = make_project(root, args.files, rng)
+        index_path = os.path.join(root, ".privacy_index")
+
+        start = time.perf_counter()
+        collect_hits(scanner.scan(root, options))
+        rescan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        update_index(scanner, root, index_path, options)
+        build = time.perf_counter() - start
+
+        for path in rng.sample(paths, args.changed):
+            with open(path, "a") as f:
+                f.write(LINES[1])
+        start = time.perf_counter()
+        scanned, reused, _ = update_index(scanner, root, index_path, options)
+        incremental = time.perf_counter() - start
+
+        timings = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            with PrivacyIndex(index_path) as index:
+                if i % 2:
+                    index.category_hits("NSPrivacyAccessedAPICategoryDiskSpace")
+                else:
+                    index.dependency_paths("Alamofire")
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+
+        print(f"files: {args.files}, index size: {os.path.getsize(index_path) / 1e6:.2f} MB")
+        print(f"full rescan:         {rescan * 1000:9.1f} ms")
+        print(f"index build:         {build * 1000:9.1f} ms")
+        print(f"incremental update:  {incremental * 1000:9.1f} ms ({scanned} scanned, {reused} reused)")
+        print(f"query p50 / p99:     {timings[len(timings) // 2] * 1000:9.2f} ms / {timings[len(timings) * 99 // 100] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare hit counts and throughput of scanning with and without comment/string-literal masking.
+
+Two synthetic corpora are generated: a "typical" one where a small share of the files mention
+API names, and a "dense" one where every file mentions them in comments, strings and code.
+
+    python benchmarks/bench_lexer.py [--files 2000] [--mention-rate 0.1] [--repeat 3]
+
+比較啟用與不啟用註釋/字符串遮蔽時的命中數量與掃描速度。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_privacy_info import Scanner, expand_file_hits  # noqa: E402
+
+PLAIN = [
+    "let value = compute(first: 1, second: 2)\n",
+    "func update(_ item: Item) -> Bool { return item.isValid }\n",
+    "    guard let model = repository.load(id) else { return nil }\n",
+    "/// Returns the formatted title for the given section.\n",
+    "let title = NSLocalizedString(\"settings.title\", comment: \"\")\n",
+]
+MENTIONS = [
+    "/// Reads the cached flag from UserDefaults.\n",
+    "// TODO: stop using creationDate once the server sends timestamps\n",
+    "let key = \"volumeAvailableCapacityKey\"\n",
+    "/* systemUptime is only used for logging */\n",
+    "logger.debug(\"mach_absolute_time() overflow\")\n",
+]
+CODE = [
+    "let defaults = UserDefaults.standard\n",
+    "let date = attributes.creationDate\n",
+    "let uptime = ProcessInfo.processInfo.systemUptime\n",
+]
+
+
+def make_corpus(root, files, mention_rate, rng):
+    paths = []
+    for i in range(files):
+        lines = [rng.choice(PLAIN) for _ in range(200)]
+        if rng.random() < mention_rate:
+            for _ in range(6):
+                lines.insert(rng.randrange(len(lines)), rng.choice(MENTIONS))
+            lines.insert(rng.randrange(len(lines)), rng.choice(CODE))
+        path = os.path.join(root, f"File{i}.swift")
+        with open(path, "w") as f:
+            f.writelines(lines)
+        paths.append(path)
+    return paths
+
+
+def measure(scanner, paths, mask_literals, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = sum(1 for path in paths for _ in expand_file_hits(scanner.scan_file(path, True, True, mask_literals)))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return hits, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--mention-rate", type=float, default=0.1, help="share of files mentioning APIs in the typical corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    scanner = Scanner()
+    print(f"{'corpus':<8} {'masking':<8} {'hits':>7} {'time (s)':>9} {'MB/s':>7} {'overhead':>9}")
+    for corpus, rate in (("typical", args.mention_rate), ("dense", 1.0)):
+        with tempfile.TemporaryDirectory() as root:
+            paths = make_corpus(root, args.files, rate, rng)
+            megabytes = sum(os.path.getsize(path) for path in paths) / 1e6
+            base_hits, base_time = measure(scanner, paths, False, args.repeat)
+            mask_hits, mask_time = measure(scanner, paths, True, args.repeat)
+            print(f"{corpus:<8} {'off':<8} {base_hits:>7} {base_time:>9.3f} {megabytes / base_time:>7.1f} {'':>9}")
+            print(f"{corpus:<8} {'on':<8} {mask_hits:>7} {mask_time:>9.3f} {megabytes / mask_time:>7.1f} "
+                  f"{(mask_time / base_time - 1) * 100:>8.1f}%")
+    scanner.close()
+
+
+if __name__ == "__main__":
+    main()
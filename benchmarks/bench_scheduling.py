@@ -0,0 +1,78 @@
+"""
+Compare walk-order scheduling with size-aware (largest-first, batched) scheduling.
+
+A synthetic project with many small files and a few large files is generated; the large files
+are placed at the end of the work list to reproduce the case where they are found last in the walk.
+Scans use the default ScanOptions (dependency search and dedup on), so the task count is all the work
+submitted to the pool.
+
+    python benchmarks/bench_scheduling.py [--small 4000] [--large 4] [--large-mb 4] [--workers 4] [--repeat 3]
+
+比較按遍歷順序調度與按文件大小調度（大文件優先、小文件合併）的掃描耗時與尾部延遲。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_privacy_info import Scanner, ScanOptions, ScanRun, collect_hits  # noqa: E402
+
+SMALL_FILE = "import Foundation\nlet defaults = UserDefaults.standard\n" + "let value = compute(1, 2, 3)\n" * 60
+LARGE_LINE = "let uptime = ProcessInfo.processInfo.systemUptime + offset(of: item, in: collection)\n"
+
+
+def make_project(root, small, large, large_mb):
+    for i in range(small):
+        directory = os.path.join(root, "Sources", f"Module{i % 50}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"File{i}.swift"), "w") as f:
+            f.write(SMALL_FILE + f"// {i}\n")
+    directory = os.path.join(root, "Generated")
+    os.makedirs(directory, exist_ok=True)
+    for i in range(large):
+        with open(os.path.join(directory, f"Large{i}.swift"), "w") as f:
+            f.write(LARGE_LINE * (large_mb * 1024 * 1024 // len(LARGE_LINE)) + f"// {i}\n")
+
+
+def run_once(scanner, root, files, options):
+    completions = []
+    start = time.perf_counter()
+    run = ScanRun(scanner, [root], files, options, progress=lambda done, total: completions.append(time.perf_counter() - start))
+    found_patterns, _, _ = collect_hits(run)
+    total = time.perf_counter() - start
+    # 尾部延遲：從第一個工作線程空閒到掃描結束的時間
+    # Tail latency: time from the first worker going idle until the scan finishes
+    tail = total - completions[-scanner.max_workers] if len(completions) >= scanner.max_workers else total
+    return total, tail, len(completions), sum(len(occurrences) for occurrences in found_patterns.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--small", type=int, default=4000, help="number of small files")
+    parser.add_argument("--large", type=int, default=4, help="number of large files")
+    parser.add_argument("--large-mb", type=int, default=4, help="size of each large file in MB")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root, Scanner(max_workers=args.workers) as scanner:
+        make_project(root, args.small, args.large, args.large_mb)
+        options = ScanOptions()
+        files = scanner.enumerate_files([root], options)
+        # 大文件放在最後，模擬遍歷結束時才發現大文件
+        # Large files last, as if they were discovered at the end of the walk
+        walk_order = sorted(files, key=lambda item: "Generated" in item[0])
+
+        print(f"{len(files)} files, {sum(size for _, _, size in files) / 1e6:.1f} MB, {args.workers} workers")
+        print(f"{'scheduling':<12} {'tasks':>6} {'hits':>8} {'wall (s)':>10} {'tail (s)':>10}")
+        for name, schedule in (("walk order", False), ("size-aware", True)):
+            results = [run_once(scanner, root, walk_order, options._replace(schedule=schedule)) for _ in range(args.repeat)]
+            total, tail, tasks, hits = min(results)
+            print(f"{name:<12} {tasks:>6} {hits:>8} {total:>10.3f} {tail:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
 import argparse
+import bisect
 import os
 import datetime
+import hashlib
+import http.client
+import json
+import mmap
+import urllib.error
 import urllib.request
 import xml.etree.ElementTree as ET
 import re
+import sqlite3
+import zlib
+from array import array
+from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import stat
+import struct
 import sys
+import threading
 import time
 
+try:
+    import numpy
+except ImportError:  # NumPy 為可選依賴 / NumPy is optional, see offsets_to_lines
+    numpy = None
+
 # https://developer.apple.com/documentation/bundleresources/privacy_manifest_files/describing_use_of_required_reason_api
 # 根據蘋果官方文檔描述所需的原因 API
 api_patterns = {
@@ -127,13 +145,22 @@ dependencies_info = {
 }
 
 
-compiled_attracking_pattern = re.compile(r'ATTrackingManager.requestTrackingAuthorization')
+# Scanner.scan 產出的命中記錄
+# Hit records yielded by Scanner.scan
+ApiHit = namedtuple('ApiHit', ['category', 'path', 'line'])
+DependencyHit = namedtuple('DependencyHit', ['name', 'path'])
+TrackingHit = namedtuple('TrackingHit', ['path'])
+
+# 單個文件的掃描結果：api_lines 為 {類別: array('I') 行號}
+# Scan result of one file: api_lines maps each category to an array('I') of line numbers
+FileHits = namedtuple('FileHits', ['path', 'api_lines', 'deps', 'attracking'])
 
-# 在全局作用域預編譯正則表達式
-# Precompile regular expressions for global scope
-compiled_api_patterns = {key: [re.compile(pattern) for pattern in patterns] for key, patterns in api_patterns.items()}
-compiled_dep_patterns_swift = {dep: re.compile(r'import\s+' + re.escape(dep)) for dep in dependencies_info.keys()}
-compiled_dep_patterns_objc = {dep: re.compile(r'#import\s+["<]' + re.escape(dep) + r'[\./]') for dep in dependencies_info.keys()}
+# 掃描選項，對應互動提示的答案
+# Scan options, matching the answers to the interactive prompts
+ScanOptions = namedtuple('ScanOptions', ['search_apis', 'search_deps', 'excluded_dirs_api', 'excluded_dirs_deps', 'shard', 'dedup', 'only_files', 'schedule', 'pod_cache', 'mask_literals'],
+                         defaults=[True, True, (), (), None, True, None, True, True, False])
+
+SOURCE_EXTENSIONS = ('.swift', '.m', '.h')
 
 # 請求用戶輸入的函數
 # Function to request user input
@@ -141,41 +168,172 @@ def user_input(message):
     return input(message)
     
 
+# 下載參數：每個請求的超時秒數、暫時性錯誤的重試次數與退避基數，以及多模塊套件的並發下載數
+# Download parameters: per-request timeout, attempts and backoff for transient errors,
+# and the number of concurrent downloads for multi-module dependencies
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_BACKOFF_SECONDS = 0.5
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_CHUNK_BYTES = 16 * 1024
+
+# 單個 PrivacyInfo.xcprivacy 的下載結果
+# Result of downloading one PrivacyInfo.xcprivacy
+DownloadResult = namedtuple('DownloadResult', ['key', 'url', 'save_path', 'ok', 'attempts', 'error'])
+
+
+class InvalidPlistError(ValueError):
+    """
+    The downloaded payload is not a property list, e.g. an HTML error page.
+    下載的內容不是屬性列表，例如 HTML 錯誤頁面。
+    """
+
+
+def stream_plist(response, out_file):
+    """
+    Copy a response to out_file chunk by chunk while feeding each chunk to an XML pull parser,
+    so an HTML error page is rejected as soon as its first element arrives.
+    The document must be a <plist> whose top-level value is a <dict>.
+    A body shorter than its Content-Length raises http.client.IncompleteRead, since a transfer cut short
+    is a network failure rather than an invalid plist.
+    逐塊將響應寫入 out_file，同時將每塊交給 XML 拉取解析器驗證，HTML 錯誤頁面在第一個元素到達時即被拒絕。
+    文檔必須是頂層值為 <dict> 的 <plist>。內容短於 Content-Length 時拋出 http.client.IncompleteRead，因為傳輸中斷屬於網絡錯誤。
+    """
+    parser = ET.XMLPullParser(events=('start',))
+    elements = 0
+    received = 0
+    try:
+        for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_BYTES), b''):
+            received += len(chunk)
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                elements += 1
+                if elements == 1 and element.tag != 'plist':
+                    raise InvalidPlistError(f"expected a plist, got <{element.tag}>")
+                if elements == 2 and element.tag != 'dict':
+                    raise InvalidPlistError(f"expected a dict at the top of the plist, got <{element.tag}>")
+            out_file.write(chunk)
+        expected = response.headers.get('Content-Length')
+        if expected and expected.isdigit() and received < int(expected):
+            raise http.client.IncompleteRead(b'', int(expected) - received)
+        parser.close()
+    except ET.ParseError as e:
+        raise InvalidPlistError(f"not a valid plist ({e})")
+    if elements < 2:
+        raise InvalidPlistError("empty plist")
+
+
+def fetch_privacy_manifest(url, save_path, key=None, attempts=DOWNLOAD_ATTEMPTS, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Download and validate one PrivacyInfo.xcprivacy, returning a DownloadResult.
+    The file is written next to save_path and only moved into place once it parsed as a plist.
+    Network errors, timeouts, truncated transfers and HTTP 429/5xx are retried with exponential backoff;
+    other HTTP errors, malformed URLs and invalid payloads fail at once. Errors are returned, never raised.
+    下載並驗證單個 PrivacyInfo.xcprivacy，返回 DownloadResult。文件先寫入臨時文件，解析為 plist 後才移動到 save_path。
+    網絡錯誤、超時、傳輸中斷以及 HTTP 429/5xx 會以指數退避重試，其他 HTTP 錯誤、無效 URL 與無效內容立即失敗。錯誤只返回，不會拋出。
+    """
+    temp_path = save_path + '.part'
+    error = None
+    for attempt in range(1, attempts + 1):
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response, open(temp_path, 'wb') as out_file:
+                stream_plist(response, out_file)
+            os.replace(temp_path, save_path)
+            return DownloadResult(key, url, save_path, True, attempt, None)
+        except urllib.error.HTTPError as e:
+            error = f"HTTP {e.code} {e.reason}"
+            retry = e.code == 429 or e.code >= 500
+        except InvalidPlistError as e:
+            error = str(e)
+            retry = False
+        except http.client.IncompleteRead as e:
+            error = f"transfer cut short, {e.expected} bytes missing"
+            retry = True
+        except urllib.error.URLError as e:
+            error = str(e.reason)
+            # 網絡錯誤的 reason 是 OSError；字符串（例如未知的 URL 協議）重試也不會成功
+            # Network failures carry an OSError; a plain reason such as an unknown URL scheme will not recover
+            retry = isinstance(e.reason, OSError)
+        except (http.client.HTTPException, OSError) as e:
+            error = str(e) or type(e).__name__
+            retry = True
+        except ValueError as e:
+            # 例如無效的 URL
+            # e.g. a malformed URL
+            error = str(e)
+            retry = False
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if not retry:
+            break
+        if attempt < attempts:
+            time.sleep(DOWNLOAD_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return DownloadResult(key, url, save_path, False, attempt, error)
+
+
 def download_file(url, save_path):
     """
     Download a file from a URL and save it to the specified path using urllib.
-    從 URL 下載文件並使用 urllib 保存到指定路徑。
+    The payload must be a valid plist; returns whether the file was saved.
+    從 URL 下載文件並使用 urllib 保存到指定路徑。內容必須是有效的 plist，返回是否已保存。
     """
-    try:
-        with urllib.request.urlopen(url) as response, open(save_path, 'wb') as out_file:
-            data = response.read()  # a `bytes` object
-            out_file.write(data)
+    result = fetch_privacy_manifest(url, save_path)
+    if result.ok:
         print(f"File downloaded successfully and saved to {save_path}")
-    except Exception as e:
-        print(f"An error occurred while downloading the file: {e}")
+    else:
+        print(f"An error occurred while downloading the file: {result.error}")
+    return result.ok
 
 
 def process_dependency(name, url_info, base_dir="Deps_PrivacyInfos"):
     """
-    處理每個套件的下載邏輯。
-    Process the download logic for each dependency.
+    處理每個套件的下載邏輯。多模塊套件的各個子模塊並發下載，失敗不會阻塞其他子模塊。
+    Process the download logic for each dependency. The modules of a multi-module dependency
+    are downloaded concurrently; a failing module does not hold up the others.
+    Returns the DownloadResult of each file.
     """
     if "No,GitHub:" in url_info:
         print(f"No download link for {name}, skipping.GitHub: {url_info}")
-        return
+        return []
 
     target_dir = os.path.join(base_dir, name)
     os.makedirs(target_dir, exist_ok=True)
 
     if isinstance(url_info, str):  # 單個URL
-        download_file(url_info, os.path.join(target_dir, "PrivacyInfo.xcprivacy"))
-        print(f"Downloaded PrivacyInfo.xcprivacy for {name}.")
+        result = fetch_privacy_manifest(url_info, os.path.join(target_dir, "PrivacyInfo.xcprivacy"))
+        if result.ok:
+            print(f"Downloaded PrivacyInfo.xcprivacy for {name}.")
+        else:
+            print(f"Failed to download PrivacyInfo.xcprivacy for {name} 下載失敗: {result.error}")
+        return [result]
     elif isinstance(url_info, dict):  # URL信息是字典形式
-        for key, url in url_info.items():
-            sub_dir = os.path.join(target_dir, key)
-            os.makedirs(sub_dir, exist_ok=True)
-            download_file(url, os.path.join(sub_dir, "PrivacyInfo.xcprivacy"))
-            print(f"Downloaded PrivacyInfo.xcprivacy for {name} ({key}).")
+        start = time.perf_counter()
+        results = []
+        with ThreadPoolExecutor(min(DOWNLOAD_WORKERS, len(url_info)) or 1) as executor:
+            futures = {}
+            for key, url in url_info.items():
+                sub_dir = os.path.join(target_dir, key)
+                os.makedirs(sub_dir, exist_ok=True)
+                save_path = os.path.join(sub_dir, "PrivacyInfo.xcprivacy")
+                futures[executor.submit(fetch_privacy_manifest, url, save_path, key)] = (key, url, save_path)
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 意外錯誤只記錄在該模塊的結果中，不影響其他模塊
+                    # An unexpected error is recorded for this module only, the others carry on
+                    result = DownloadResult(*futures[future], False, 1, str(e) or type(e).__name__)
+                results.append(result)
+                if result.ok:
+                    print(f"Downloaded PrivacyInfo.xcprivacy for {name} ({result.key}).")
+                else:
+                    print(f"Failed to download PrivacyInfo.xcprivacy for {name} ({result.key}) 下載失敗 "
+                          f"after {result.attempts} attempt(s): {result.error}")
+        downloaded = sum(1 for result in results if result.ok)
+        print(f"Downloaded {downloaded}/{len(results)} modules of {name} in {time.perf_counter() - start:.2f}s "
+              f"已下載 {name} 的 {downloaded}/{len(results)} 個模塊")
+        return sorted(results, key=lambda result: list(url_info).index(result.key))
+    return []
 
 
 def process_file(file_path, is_api_search, search_deps, found_attracking):
@@ -185,122 +343,1927 @@ def process_file(file_path, is_api_search, search_deps, found_attracking):
     Search for files in a specified directory, checking for API usage and dependencies
     """
 
+    found_patterns, found_deps, search_tracking_auth = collect_hits(expand_file_hits(default_scanner().scan_file(file_path, is_api_search, search_deps)))
+    return found_patterns, found_deps, found_attracking or search_tracking_auth
+
+
+def cache_dir(*parts):
+    """
+    Return (and create) a directory in the user-level cache, e.g. ~/.cache/update_privacy_info/<parts>.
+    The location can be changed with the UPDATE_PRIVACY_INFO_CACHE environment variable.
+    返回（並創建）用戶級緩存目錄，可用 UPDATE_PRIVACY_INFO_CACHE 環境變量修改位置。
+    """
+    base = os.environ.get("UPDATE_PRIVACY_INFO_CACHE") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "update_privacy_info")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+openstep_token_pattern = re.compile(r"""
+    \s+ | //[^\n]* | /\*.*?\*/               # whitespace and comments
+    | (?P<quoted>"(?:[^"\\]|\\.)*")            # "quoted string"
+    | (?P<bare>[A-Za-z0-9_$+/:.\-]+)           # bare string
+    | (?P<punct>[{}();=,])
+    """, re.VERBOSE | re.DOTALL)
+
+openstep_escapes = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\', "'": "'"}
+
+
+def parse_openstep_plist(text):
+    """
+    Parse an old-style (OpenStep) ASCII property list such as project.pbxproj into dicts, lists and strings.
+    解析舊式 (OpenStep) ASCII 屬性列表，例如 project.pbxproj。
+    """
+    tokens = []
+    position = 0
+    if text.startswith('// !$*UTF8*$!'):
+        position = text.index('\n') + 1
+    while position < len(text):
+        match = openstep_token_pattern.match(text, position)
+        if not match:
+            raise ValueError(f"unexpected character {text[position]!r} at offset {position}")
+        position = match.end()
+        if match.group('quoted') is not None:
+            tokens.append(('string', re.sub(r'\\(.)', lambda m: openstep_escapes.get(m.group(1), m.group(1)), match.group('quoted')[1:-1])))
+        elif match.group('bare') is not None:
+            tokens.append(('string', match.group('bare')))
+        elif match.group('punct') is not None:
+            tokens.append((match.group('punct'), None))
+
+    def kind_at(i):
+        # 文件被截斷時報告為格式錯誤，而不是 IndexError
+        # A truncated file is reported as malformed input rather than an IndexError
+        if i >= len(tokens):
+            raise ValueError("unexpected end of property list")
+        return tokens[i][0]
+
+    def parse_value(i):
+        kind = kind_at(i)
+        if kind == 'string':
+            return tokens[i][1], i + 1
+        if kind == '{':
+            result = {}
+            i += 1
+            while kind_at(i) != '}':
+                key, i = parse_value(i)
+                if kind_at(i) != '=':
+                    raise ValueError(f"expected '=' after key {key!r}")
+                result[key], i = parse_value(i + 1)
+                if kind_at(i) != ';':
+                    raise ValueError(f"expected ';' after value of {key!r}")
+                i += 1
+            return result, i + 1
+        if kind == '(':
+            result = []
+            i += 1
+            while kind_at(i) != ')':
+                item, i = parse_value(i)
+                result.append(item)
+                if kind_at(i) == ',':
+                    i += 1
+            return result, i + 1
+        raise ValueError(f"unexpected token {kind!r}")
+
+    value, _ = parse_value(0)
+    return value
+
+
+def build_project_graph(pbxproj, project_dir):
+    """
+    Resolve the Sources and Headers build phases of every native target to absolute file paths, and record the
+    PrivacyInfo.xcprivacy files its Resources build phase copies. Files are resolved through their group hierarchy. Xcode 16 synchronized folders are only recorded as
+    (folder, membership exceptions), since their contents change without touching project.pbxproj;
+    target_files expands them on disk.
+    將每個原生 target 的 Sources 與 Headers 建置階段解析為絕對文件路徑，並記錄其 Resources 建置階段中的
+    PrivacyInfo.xcprivacy。Xcode 16 同步文件夾的內容變化不會修改
+    project.pbxproj，因此只記錄 (文件夾, 排除成員)，由 target_files 在磁盤上展開。
+    Raises ValueError when an object the project refers to is missing. 引用的對象不存在時拋出 ValueError。
+    """
+    if not isinstance(pbxproj, dict) or not isinstance(pbxproj.get('objects'), dict):
+        raise ValueError("project.pbxproj has no objects dictionary")
+    objects = pbxproj['objects']
+
+    def lookup(object_id):
+        obj = objects.get(object_id)
+        if not isinstance(obj, dict):
+            raise ValueError(f"project.pbxproj refers to missing object {object_id!r}")
+        return obj
+
+    project = lookup(pbxproj.get('rootObject'))
+    source_root = os.path.normpath(os.path.join(project_dir, project.get('projectDirPath', '')))
+
+    parents = {}
+    for object_id, obj in objects.items():
+        for child in obj.get('children', ()) if isinstance(obj, dict) else ():
+            parents[child] = object_id
+
+    resolved = {}
+
+    def resolve(object_id):
+        if object_id in resolved:
+            return resolved[object_id]
+        obj = lookup(object_id)
+        source_tree = obj.get('sourceTree', '<group>')
+        path = obj.get('path', '')
+        if source_tree == '<absolute>':
+            result = path
+        elif source_tree == 'SOURCE_ROOT':
+            result = os.path.join(source_root, path)
+        elif source_tree == '<group>':
+            parent = parents.get(object_id)
+            base = resolve(parent) if parent else source_root
+            result = None if base is None else os.path.join(base, path)
+        else:
+            # BUILT_PRODUCTS_DIR, SDKROOT 等不在項目目錄中
+            # BUILT_PRODUCTS_DIR, SDKROOT and similar trees are not part of the project sources
+            result = None
+        resolved[object_id] = None if result is None else os.path.normpath(result)
+        return resolved[object_id]
+
+    targets = {}
+    for target_id, obj in objects.items():
+        if not isinstance(obj, dict) or obj.get('isa') != 'PBXNativeTarget':
+            continue
+        files = []
+        privacy_manifests = []
+        for phase_id in obj.get('buildPhases', ()):
+            phase = lookup(phase_id)
+            is_resources = phase.get('isa') == 'PBXResourcesBuildPhase'
+            if phase.get('isa') not in ('PBXSourcesBuildPhase', 'PBXHeadersBuildPhase') and not is_resources:
+                continue
+            for build_file_id in phase.get('files', ()):
+                file_ref = lookup(build_file_id).get('fileRef')
+                if file_ref is None:
+                    continue
+                # 本地化文件組 (PBXVariantGroup) 包含多個文件
+                # Variant groups (localized files) contain several file references
+                for ref in lookup(file_ref).get('children', [file_ref]):
+                    path = resolve(ref)
+                    if not path:
+                        continue
+                    if is_resources:
+                        if os.path.basename(path) == 'PrivacyInfo.xcprivacy':
+                            privacy_manifests.append(path)
+                    elif path.endswith(SOURCE_EXTENSIONS):
+                        files.append(path)
+
+        synchronized = []
+        for group_id in obj.get('fileSystemSynchronizedGroups', ()):
+            folder = resolve(group_id)
+            if not folder:
+                continue
+            exceptions = set()
+            for exception_id in lookup(group_id).get('exceptions', ()):
+                exception = lookup(exception_id)
+                if exception.get('target') == target_id:
+                    exceptions.update(os.path.normpath(os.path.join(folder, m)) for m in exception.get('membershipExceptions', ()))
+            synchronized.append([folder, sorted(exceptions)])
+
+        targets[obj.get('name')] = {"files": sorted(set(files)), "synchronized": synchronized,
+                                    "privacy_manifests": sorted(set(privacy_manifests))}
+    return {"targets": targets}
+
+
+def synchronized_folder_files(folder, exceptions):
+    """
+    List the source and header files currently in a synchronized folder, minus its membership exceptions.
+    列出同步文件夾中當前的源文件與頭文件，排除其例外成員。
+    """
+    exceptions = set(exceptions)
+    files = []
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            if name.endswith(SOURCE_EXTENSIONS) and path not in exceptions:
+                files.append(path)
+    return files
+
+
+_project_graphs = {}
+
+# 緩存的項目結構格式，格式變化時舊緩存失效
+# Format of cached project graphs; older cache entries are ignored
+PROJECT_GRAPH_FORMAT = 3
+
+
+def load_xcode_project(xcodeproj_path):
+    """
+    Return the project graph ({"targets": {name: {"files": [...], "synchronized": [[folder, exceptions], ...],
+    "privacy_manifests": [...]}}}) of an .xcodeproj. Parsed graphs only hold what project.pbxproj defines, so they are cached in memory and
+    in the user cache, keyed by the project.pbxproj mtime.
+    返回 .xcodeproj 的項目結構。結構只包含 project.pbxproj 定義的內容，按其修改時間緩存在內存和用戶緩存目錄中。
+    """
+    pbxproj_path = os.path.abspath(os.path.join(xcodeproj_path, 'project.pbxproj'))
+    mtime_ns = os.stat(pbxproj_path).st_mtime_ns
+    cached = _project_graphs.get(pbxproj_path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+
+    cache_path = os.path.join(cache_dir('xcodeproj'), hashlib.blake2b(pbxproj_path.encode('utf-8'), digest_size=16).hexdigest() + '.json')
+    graph = None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        if entry.get("format") == PROJECT_GRAPH_FORMAT and entry.get("mtime_ns") == mtime_ns:
+            graph = entry["graph"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if graph is None:
+        with open(pbxproj_path, 'r', encoding='utf-8') as f:
+            pbxproj = parse_openstep_plist(f.read())
+        graph = build_project_graph(pbxproj, os.path.dirname(os.path.dirname(pbxproj_path)))
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({"format": PROJECT_GRAPH_FORMAT, "mtime_ns": mtime_ns, "graph": graph}, f)
+        except OSError:
+            pass
+
+    _project_graphs[pbxproj_path] = (mtime_ns, graph)
+    return graph
+
+
+def target_files(xcodeproj_path, target):
+    """
+    Return the source and header files compiled by a target of an .xcodeproj.
+    Synchronized folders are expanded on disk at every call, so newly added files are always included.
+    返回 .xcodeproj 中某個 target 編譯的源文件與頭文件。同步文件夾每次都在磁盤上展開，新增的文件總會被包含。
+    """
+    targets = load_xcode_project(xcodeproj_path)["targets"]
+    if target not in targets:
+        raise ValueError(f"target {target!r} not found in {xcodeproj_path}, available targets: {', '.join(sorted(targets))}")
+    files = set(targets[target]["files"])
+    for folder, exceptions in targets[target]["synchronized"]:
+        files.update(synchronized_folder_files(folder, exceptions))
+    return sorted(files)
+
+
+def target_privacy_manifest(xcodeproj_path, target):
+    """
+    Return the PrivacyInfo.xcprivacy bundled by a target: the one in its Resources build phase, else one inside its
+    synchronized folders. Returns None when the target has none.
+    返回 target 打包的 PrivacyInfo.xcprivacy：優先取 Resources 建置階段中的文件，其次為同步文件夾中的文件；沒有時返回 None。
+    """
+    targets = load_xcode_project(xcodeproj_path)["targets"]
+    if target not in targets:
+        raise ValueError(f"target {target!r} not found in {xcodeproj_path}, available targets: {', '.join(sorted(targets))}")
+    if targets[target]["privacy_manifests"]:
+        return targets[target]["privacy_manifests"][0]
+    for folder, exceptions in targets[target]["synchronized"]:
+        exceptions = set(exceptions)
+        for root, dirs, names in os.walk(folder):
+            dirs.sort()
+            path = os.path.join(root, 'PrivacyInfo.xcprivacy')
+            if 'PrivacyInfo.xcprivacy' in names and path not in exceptions:
+                return path
+    return None
+
+
+def relative_path(file_path, directory):
+    """
+    Return the path of a file relative to the project directory, always with '/' separators.
+    返回文件相對於項目目錄的路徑，統一使用 '/' 分隔。
+    """
+    return os.path.relpath(file_path, directory).replace(os.sep, '/')
+
+
+def parse_shard(value):
+    """
+    Parse a `i/N` shard specification (1-based) into an (index, count) tuple.
+    解析 `i/N` 格式的分片參數（從1開始），返回 (index, count)。
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected i/N (e.g. 1/4)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', i must be between 1 and N")
+    return index, count
+
+
+def in_shard(rel_path, shard):
+    """
+    Deterministically decide whether a file belongs to the given shard.
+    The file is assigned by a stable hash of its path relative to the project directory,
+    so every CI job computes the same partition regardless of checkout location.
+    根據文件相對路徑的穩定哈希值，決定文件是否屬於指定分片。
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    key = rel_path.encode('utf-8')
+    return zlib.crc32(key) % count == index - 1
+
+
+def scan_options_key(options):
+    """
+    Return the ScanOptions that change which hits a scan finds, as a JSON-serializable list.
+    Results scanned with different keys must not be reused or combined.
+    返回會影響掃描結果的 ScanOptions（可序列化為 JSON 的列表），鍵不同的結果不可沿用或合併。
+    """
+    return [options.search_apis, options.search_deps,
+            sorted(options.excluded_dirs_api), sorted(options.excluded_dirs_deps), options.mask_literals]
+
+
+def sort_found_patterns(found_patterns):
+    """
+    Return found_patterns in a canonical order: categories in `api_patterns` order, occurrences by path and line.
+    將搜索結果排序為固定順序，使輸出與處理順序無關。
+    """
+    category_order = {category: i for i, category in enumerate(api_patterns)}
+    ordered = sorted(found_patterns, key=lambda category: (category_order.get(category, len(category_order)), category))
+    return {category: sorted(found_patterns[category]) for category in ordered}
+
+
+class ContentMemo:
+    """
+    FileHits of the contents already scanned in one run, keyed by (BLAKE2b digest of the bytes, search mode, language),
+    so a file whose contents were already scanned the same way is not matched again.
+    The digest is taken from the bytes scan_file reads anyway, so every file is still read exactly once.
+    Shared by the worker threads of a run.
+    單次掃描中已掃描內容的 FileHits，鍵為 (文件字節的 BLAKE2b 摘要, 搜索模式, 語言)，相同內容不會重覆匹配。
+    摘要取自 scan_file 本來就要讀取的字節，每個文件仍只讀取一次。由同一次掃描的工作線程共用。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file_hits = {}
+        self.reused_files = 0
+        self.reused_bytes = 0
+
+    def get(self, key, size):
+        with self.lock:
+            file_hits = self.file_hits.get(key)
+            if file_hits is not None:
+                self.reused_files += 1
+                self.reused_bytes += size
+            return file_hits
+
+    def put(self, key, file_hits):
+        with self.lock:
+            self.file_hits.setdefault(key, file_hits)
+
+
+# 排程參數：小於 SMALL_FILE_BYTES 的文件會合併成約 BATCH_BYTES 大小的批次
+# Scheduling parameters: files below SMALL_FILE_BYTES are coalesced into batches of about BATCH_BYTES
+SMALL_FILE_BYTES = 64 * 1024
+BATCH_BYTES = 256 * 1024
+BATCH_MAX_FILES = 64
+
+# 讀取探測的平均耗時超過此值時，視為 I/O 受限（冷緩存或網絡文件系統）
+# Average probe read time above which a run is treated as I/O-bound (cold cache or network filesystem)
+IO_PROBE_SECONDS = 0.002
+IO_PROBE_FILES = 8
+IO_PROBE_BYTES = 64 * 1024
+
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afpfs', 'webdav', 'davfs', 'fuse.sshfs', '9p', 'ceph', 'glusterfs'}
+
+
+def plan_batches(files_to_process, schedule=True):
+    """
+    Split (file_path, search_api, size) entries into work batches, largest files first.
+    Large files get a batch of their own; small files are coalesced to amortize per-task overhead.
+    Without `schedule`, every file is its own batch in enumeration order.
+    將待掃描文件按大小從大到小分批：大文件單獨成批，小文件合併成批以減少任務開銷。
+    """
+    if not schedule:
+        return [[(file_path, search_api)] for file_path, search_api, _ in files_to_process]
+
+    batches = []
+    current = []
+    current_bytes = 0
+    for file_path, search_api, size in sorted(files_to_process, key=lambda item: item[2], reverse=True):
+        if size >= SMALL_FILE_BYTES:
+            batches.append([(file_path, search_api)])
+            continue
+        current.append((file_path, search_api))
+        current_bytes += size
+        if current_bytes >= BATCH_BYTES or len(current) >= BATCH_MAX_FILES:
+            batches.append(current)
+            current = []
+            current_bytes = 0
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_network_filesystem(path):
+    """
+    Check /proc/mounts for whether a path lives on a network filesystem. Returns False where /proc is unavailable.
+    通過 /proc/mounts 判斷路徑是否位於網絡文件系統上。
+    """
+    try:
+        with open('/proc/mounts', 'r') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except OSError:
+        return False
+    path = os.path.realpath(path)
+    best_mount, best_type = '', ''
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best_mount):
+            best_mount, best_type = mount_point, fs_type
+    return best_type in NETWORK_FILESYSTEMS
+
+
+def is_io_bound(paths, files_to_process):
+    """
+    Decide whether a scan will be dominated by I/O: the files are on a network filesystem,
+    or a few probe reads of the largest files are slow (cold cache).
+    判斷掃描是否受 I/O 限制：文件位於網絡文件系統，或讀取最大的幾個文件時速度較慢（冷緩存）。
+    """
+    if any(is_network_filesystem(directory) for directory in paths):
+        return True
+    largest = sorted(files_to_process, key=lambda item: item[2], reverse=True)[:IO_PROBE_FILES]
+    if not largest:
+        return False
+    start = time.perf_counter()
+    for file_path, _, _ in largest:
+        try:
+            with open(file_path, 'rb') as f:
+                f.read(IO_PROBE_BYTES)
+        except OSError:
+            pass
+    return (time.perf_counter() - start) / len(largest) > IO_PROBE_SECONDS
+
+
+def choose_worker_count(io_bound):
+    """
+    Pick the number of worker threads: more threads than CPUs hide I/O latency,
+    while CPU-bound regex matching gains nothing from threads beyond the CPU count.
+    選擇工作線程數：I/O 受限時使用較多線程以隱藏延遲，CPU 受限時與 CPU 數量相同。
+    """
+    cpus = os.cpu_count() or 1
+    return min(32, cpus * 4) if io_bound else cpus
+
+
+def expand_file_hits(file_hits, path=None):
+    """
+    Yield the ApiHit, DependencyHit and TrackingHit records of a FileHits, optionally under another path.
+    產出 FileHits 中的命中記錄，可指定另一個路徑（用於內容相同的文件）。
+    """
+    path = path or file_hits.path
+    for category, lines in file_hits.api_lines.items():
+        for line in lines:
+            yield ApiHit(category, path, line)
+    for dep in file_hits.deps:
+        yield DependencyHit(dep, path)
+    if file_hits.attracking:
+        yield TrackingHit(path)
+
+
+def newline_index(text):
+    """
+    Return the character offsets of the newlines in a text as a NumPy array, or None without NumPy.
+    Build it once per file and pass it to every offsets_to_lines call on that text.
+    以 NumPy 數組返回文本中換行符的字符偏移，沒有 NumPy 時返回 None。每個文件只需建立一次，供該文本的所有 offsets_to_lines 調用使用。
+    """
+    if numpy is None:
+        return None
+    if text.isascii():
+        codes = numpy.frombuffer(text.encode('ascii'), dtype=numpy.uint8)
+    else:
+        codes = numpy.frombuffer(text.encode('utf-32-le'), dtype=numpy.uint32)
+    return numpy.flatnonzero(codes == 10)
+
+
+def offsets_to_lines(text, offsets, newlines=None):
+    """
+    Map sorted character offsets in a text to 1-based line numbers in one step:
+    a NumPy searchsorted over the newline positions from newline_index() when NumPy is available, otherwise
+    str.count between consecutive offsets, so no Python code runs per line either way.
+    將已排序的字符偏移一次性轉換為行號：有 NumPy 時在 newline_index() 的換行位置上使用 searchsorted，
+    否則在相鄰偏移之間使用 str.count。
+    """
+    if newlines is None and numpy is not None:
+        newlines = newline_index(text)
+    if newlines is not None:
+        return (numpy.searchsorted(newlines, numpy.asarray(offsets)) + 1).tolist()
+    lines = []
+    line = 1
+    previous = 0
+    for offset in offsets:
+        line += text.count('\n', previous, offset)
+        previous = offset
+        lines.append(line)
+    return lines
+
+
+def match_offsets(combined_pattern, text):
+    """
+    Run a combined pattern once over a whole buffer and return the start offsets of its matches.
+    在整個緩衝區上執行一次組合正則，返回所有匹配的起始偏移。
+    """
+    if combined_pattern is None:
+        return []
+    return [match.start() for match in combined_pattern.finditer(text)]
+
+
+def candidate_lines(text, offsets, spans=None, newlines=None):
+    """
+    Yield (line number, line text) for each line containing one of the sorted match offsets,
+    line text including its newline as readlines() would return it.
+    With `spans` from literal_spans(), the comments and string literals in each line are blanked out.
+    `newlines` is the text's newline_index(), when the caller already has it.
+    對包含匹配偏移的每一行產出 (行號, 行文本)。傳入 spans 時，行內的註釋與字符串字面量會被替換為空格。
+    newlines 為調用方已建立的 newline_index()。
+    """
+    if not offsets:
+        return
+    previous_line = 0
+    for offset, line_number in zip(offsets, offsets_to_lines(text, offsets, newlines)):
+        if line_number == previous_line:
+            continue
+        previous_line = line_number
+        start = text.rfind('\n', 0, offset) + 1
+        end = text.find('\n', offset)
+        end = len(text) if end < 0 else end + 1
+        yield line_number, text[start:end] if spans is None else mask_spans(text, start, end, spans)
+
+
+# Swift/Objective-C 的註釋與字符串字面量；前瞻讓正則引擎只在可能的起始字符處嘗試匹配
+# Comments and string literals of Swift and Objective-C; the lookahead lets the regex engine
+# only attempt a match where one can start
+literal_pattern = re.compile(r"""
+    (?=[/"'@])
+    (?: //[^\n]*                        # line comment
+      | /\*.*?\*/                       # block comment
+      | \"\"\".*?\"\"\"                     # Swift multi-line string
+      | @?"(?:[^"\\\n]|\\.)*"            # string literal, including Objective-C @"..."
+      | '(?:[^'\\\n]|\\.)*'              # Objective-C character literal
+    )
+    """, re.VERBOSE | re.DOTALL)
+
+
+def line_bounds(text, offsets):
+    """
+    Return the (start, end) ranges of the distinct lines containing the sorted offsets, newline included.
+    返回包含已排序偏移的各行的 (起, 止) 範圍，包括換行符，每行只出現一次。
+    """
+    bounds = []
+    end = -1
+    for offset in offsets:
+        if offset < end:
+            continue
+        start = text.rfind('\n', 0, offset) + 1
+        end = text.find('\n', offset)
+        end = len(text) if end < 0 else end + 1
+        bounds.append((start, end))
+    return bounds
+
+
+def literal_spans(text, lines=None):
+    """
+    Lex a buffer and return the sorted start and end offsets of its comments and string literals.
+    With `lines` from line_bounds(), the spans are only complete on those lines. Only block comments and
+    multi-line strings span lines, so the text between two of those lines is skipped unless it contains
+    a '/*' or a triple quote, in which case lexing resumes on that line.
+    Swift strings with \\( interpolation contain code, so they are left out.
+    對緩衝區做詞法分析，返回註釋與字符串字面量的起止偏移；含有 \\( 插值的 Swift 字符串包含代碼，不計入。
+    傳入 lines 時只保證這些行上的區間完整：只有塊註釋與多行字符串會跨行，因此兩行之間的文本只有在含有
+    '/*' 或三引號時才需從該處繼續分析，否則直接跳過。
+    """
+    starts = array('I')
+    ends = array('I')
+    # 已分析到的位置，總在字面量之外
+    # Lexed up to here; never inside a literal
+    position = 0
+    for line_start, line_end in lines if lines is not None else [(0, len(text))]:
+        while position < line_end:
+            openers = [opener for opener in (text.find('/*', position, line_start), text.find('"""', position, line_start))
+                       if opener >= 0]
+            if openers:
+                # 從開頭符號所在行繼續分析，直到它被消耗或跳過
+                # Lex from the opener's line until the opener has been consumed or passed
+                opener = min(openers)
+                position = max(position, text.rfind('\n', 0, opener) + 1)
+                limit = opener + 1
+            else:
+                position = max(position, line_start)
+                limit = line_end
+            end = limit
+            for match in literal_pattern.finditer(text, position):
+                if match.start() >= limit:
+                    break
+                end = max(end, match.end())
+                token = match.group()
+                if token[0] in '"@' and '\\(' in token:
+                    continue
+                starts.append(match.start())
+                ends.append(match.end())
+            else:
+                end = len(text)
+            position = end
+    return starts, ends
+
+
+def outside_spans(offsets, spans):
+    """
+    Keep the sorted offsets that do not fall inside any of the spans.
+    保留不在任何區間內的已排序偏移。
+    """
+    starts, ends = spans
+    kept = []
+    for offset in offsets:
+        index = bisect.bisect_right(starts, offset) - 1
+        if index < 0 or offset >= ends[index]:
+            kept.append(offset)
+    return kept
+
+
+def mask_spans(text, start, end, spans):
+    """
+    Return text[start:end] with the parts covered by spans replaced by spaces, keeping newlines.
+    返回 text[start:end]，其中被區間覆蓋的部分替換為空格，保留換行符。
+    """
+    starts, ends = spans
+    index = bisect.bisect_right(ends, start)
+    if index == len(starts) or starts[index] >= end:
+        return text[start:end]
+    pieces = []
+    position = start
+    while index < len(starts) and starts[index] < end:
+        span_start = max(starts[index], start)
+        span_end = min(ends[index], end)
+        pieces.append(text[position:span_start])
+        pieces.append(re.sub(r'[^\n]', ' ', text[span_start:span_end]))
+        position = span_end
+        index += 1
+    pieces.append(text[position:end])
+    return ''.join(pieces)
+
+
+def combine_patterns(patterns):
+    """
+    Combine compiled patterns into one alternation used to find candidate lines, or None when there are no patterns.
+    A leading '.' is dropped from each alternative: the result still matches on every line where the
+    original pattern does, and patterns that start with a literal let the regex engine skip ahead quickly.
+    將多個已編譯的正則合併為一個用於篩選候選行的正則，沒有正則時返回 None。
+    去掉開頭的 '.' 後仍會在原正則匹配的每一行上匹配，且以字面字符開頭的正則可讓正則引擎快速跳過。
+    """
+    alternatives = []
+    for pattern in patterns:
+        source = pattern.pattern
+        if source.startswith('.') and len(source) > 1 and source[1] not in '*+?{':
+            source = source[1:]
+        alternatives.append(f'(?:{source})')
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives))
+
+
+def collect_hits(hits):
+    """
+    Aggregate hit records into found_patterns, found_deps and the ATTracking status.
+    將命中記錄匯總為 found_patterns、found_deps 以及 ATTracking 狀態。
+    """
     found_patterns = {}
     found_deps = set()
-    if file_path.endswith(('.swift', '.m', '.h')):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            for i, line in enumerate(lines, start=1):
-                if is_api_search:  # Now using the is_api_search flag
-                    for category, patterns in compiled_api_patterns.items():
+    found_attracking = False
+    for hit in hits:
+        if isinstance(hit, ApiHit):
+            found_patterns.setdefault(hit.category, []).append((hit.path, hit.line))
+        elif isinstance(hit, DependencyHit):
+            found_deps.add(hit.name)
+        elif isinstance(hit, TrackingHit):
+            found_attracking = True
+    return sort_found_patterns(found_patterns), found_deps, found_attracking
+
+
+# CocoaPods 掃描結果緩存的默認大小上限
+# Default size limit of the user-level CocoaPods result cache
+POD_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# 一個可緩存的 pod：命中時 entry 為緩存內容，否則為 None
+# A cacheable pod; entry holds the cached result on a hit and is None on a miss
+PodPlan = namedtuple('PodPlan', ['directory', 'name', 'pod_dir', 'key', 'entry'])
+
+podfile_lock_entry_pattern = re.compile(r'^  - "?([^\s"(]+) \(([^)]+)\)"?:?$')
+
+
+def parse_podfile_lock(lock_path):
+    """
+    Return {pod name: (version, sorted installed entries)} for the pods in a Podfile.lock or Manifest.lock,
+    where the entries are the `Name/Subspec` lines listed for the pod. CocoaPods removes the files of
+    subspecs that are not installed, so the same version can have different contents in different projects.
+    Pods installed from external sources (:path, :git, :podspec) are left out, since their contents are not
+    pinned by the version alone.
+    返回 Podfile.lock 或 Manifest.lock 中的 {pod 名稱: (版本, 已安裝條目的排序列表)}，條目為該 pod 列出的
+    `名稱/子規格`。CocoaPods 會刪除未安裝子規格的文件，同一版本在不同項目中的內容可能不同。
+    不包含來自外部來源（:path、:git、:podspec）的 pod。
+    """
+    versions = {}
+    subspecs = {}
+    external = set()
+    section = None
+    with open(lock_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line and not line.startswith(' '):
+                section = line.rstrip(':')
+                continue
+            if section == 'PODS':
+                match = podfile_lock_entry_pattern.match(line)
+                if match:
+                    name = match.group(1).split('/')[0]
+                    versions.setdefault(name, match.group(2))
+                    subspecs.setdefault(name, set()).add(match.group(1))
+            elif section == 'EXTERNAL SOURCES' and re.match(r'^  "?[^\s"]', line):
+                external.add(line.strip().strip('"').rstrip(':').strip('"').split('/')[0])
+    return {name: (version, sorted(subspecs[name])) for name, version in versions.items() if name not in external}
+
+
+def pod_cache_path(key):
+    return os.path.join(cache_dir('pods'), key + '.json')
+
+
+def load_pod_cache_entry(key):
+    """
+    Return the cached result for a pod cache key, or None. A hit marks the entry as recently used.
+    返回 pod 緩存項，不存在時返回 None；命中時更新其最近使用時間。
+    """
+    path = pod_cache_path(key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return entry
+
+
+def store_pod_cache_entry(key, entry, max_bytes=POD_CACHE_MAX_BYTES):
+    """
+    Save a pod result in the cache, then evict least recently used entries until the cache fits in max_bytes.
+    保存 pod 掃描結果，然後按最近最少使用的順序清理緩存，直到總大小不超過 max_bytes。
+    """
+    path = pod_cache_path(key)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except OSError:
+        return
+    evict_pod_cache(max_bytes)
+
+
+def evict_pod_cache(max_bytes=POD_CACHE_MAX_BYTES):
+    """
+    Remove the least recently used pod cache entries until the cache fits in max_bytes.
+    刪除最近最少使用的 pod 緩存項，直到緩存總大小不超過 max_bytes。
+    """
+    entries = []
+    with os.scandir(cache_dir('pods')) as it:
+        for entry in it:
+            if entry.name.endswith('.json'):
+                try:
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def encode_pod_hits(hits, pod_dir):
+    """
+    Convert hit records into JSON rows with paths relative to the pod directory.
+    將命中記錄轉換為 JSON 行，路徑相對於 pod 目錄。
+    """
+    rows = []
+    for hit in hits:
+        path = relative_path(hit.path, pod_dir)
+        if isinstance(hit, ApiHit):
+            rows.append(["api", hit.category, path, hit.line])
+        elif isinstance(hit, DependencyHit):
+            rows.append(["dep", hit.name, path, 0])
+        else:
+            rows.append(["tracking", "", path, 0])
+    return rows
+
+
+def decode_pod_hits(rows, pod_dir):
+    """
+    Convert cached JSON rows back into hit records under the given pod directory.
+    將緩存的 JSON 行轉換回 pod 目錄下的命中記錄。
+    """
+    for kind, name, path, line in rows:
+        path = os.path.join(pod_dir, *path.split('/'))
+        if kind == "api":
+            yield ApiHit(name, path, line)
+        elif kind == "dep":
+            yield DependencyHit(name, path)
+        else:
+            yield TrackingHit(path)
+
+
+class ScanRun:
+    """
+    Iterator over the hits of one Scanner.scan call.
+    The counters are updated while iterating, so they are final once the iterator is exhausted.
+    單次 Scanner.scan 的命中記錄迭代器，計數會在迭代時更新。
+    """
+
+    def __init__(self, scanner, paths, files_to_process, options, progress=None, pod_plans=()):
+        self.scanner = scanner
+        self.paths = paths
+        self.files_to_process = files_to_process
+        self.options = options
+        self.progress = progress
+        self.pod_plans = pod_plans
+        self.cached_pods = 0
+        self.cached_files = 0
+        self.total_files = len(files_to_process)
+        self.total_bytes = sum(size for _, _, size in files_to_process)
+        self.files_processed = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.io_bound = None
+        self.workers = None
+
+    def __iter__(self):
+        if self.scanner.max_workers:
+            self.workers = self.scanner.max_workers
+        else:
+            self.io_bound = is_io_bound(self.paths, self.files_to_process)
+            self.workers = choose_worker_count(self.io_bound)
+        executor = self.scanner.get_executor(self.workers)
+
+        memo = ContentMemo() if self.options.dedup else None
+
+        # 已緩存的 pod 直接注入結果；未緩存的 pod 收集結果，掃描完成後寫入緩存
+        # Inject the results of cached pods; collect the results of the other pods to cache them afterwards
+        pending_pods = {}
+        for plan in self.pod_plans:
+            if plan.entry is None:
+                pending_pods[plan.pod_dir] = (plan, [], [])
+                continue
+            files = [path for path in plan.entry["files"]
+                     if self.options.shard is None or in_shard(relative_path(os.path.join(plan.pod_dir, path), plan.directory), self.options.shard)]
+            self.cached_pods += 1
+            self.cached_files += len(files)
+            for hit in decode_pod_hits(plan.entry["hits"], plan.pod_dir):
+                if self.options.shard is None or in_shard(relative_path(hit.path, plan.directory), self.options.shard):
+                    yield hit
+
+        pods_marker = os.sep + 'Pods' + os.sep
+
+        def pending_pod(path):
+            # 直接以 Pods/ 之後的目錄查找所屬 pod，而非逐個比較前綴
+            # Look the pod up by the directory following Pods/ instead of comparing every prefix
+            start = path.find(pods_marker)
+            while start >= 0:
+                name_end = path.find(os.sep, start + len(pods_marker))
+                if name_end >= 0 and path[:name_end] in pending_pods:
+                    return pending_pods[path[:name_end]]
+                start = path.find(pods_marker, start + 1)
+            return None
+
+        if pending_pods:
+            for file_path, _, _ in self.files_to_process:
+                bucket = pending_pod(file_path)
+                if bucket:
+                    bucket[1].append(relative_path(file_path, bucket[0].pod_dir))
+
+        futures = [executor.submit(self.scanner.scan_batch, batch, self.options.search_deps, self.options.mask_literals, memo)
+                   for batch in plan_batches(self.files_to_process, self.options.schedule)]
+        try:
+            for future in as_completed(futures):
+                for file_path, file_hits in future.result():
+                    bucket = pending_pod(file_path) if pending_pods else None
+                    for hit in expand_file_hits(file_hits):
+                        if bucket:
+                            bucket[2].append(hit)
+                        yield hit
+                    self.files_processed += 1
+                if memo is not None:
+                    self.skipped_files, self.skipped_bytes = memo.reused_files, memo.reused_bytes
+                if self.progress:
+                    self.progress(self.files_processed, self.total_files)
+        finally:
+            for future in futures:
+                future.cancel()
+
+        for plan, files, hits in pending_pods.values():
+            store_pod_cache_entry(plan.key, {
+                "pod": plan.name,
+                "files": sorted(files),
+                "hits": encode_pod_hits(hits, plan.pod_dir),
+            }, self.scanner.pod_cache_max_bytes)
+
+
+class Scanner:
+    """
+    Reusable scanner that holds the compiled rules and its worker pools,
+    so one process can scan many targets back-to-back.
+    Without `max_workers`, each scan picks the pool size from whether it is I/O- or CPU-bound.
+    可重覆使用的掃描器，保存已編譯的規則和線程池，一個進程即可連續掃描多個目標。
+
+        with Scanner() as scanner:
+            for hit in scanner.scan(["App", "Widget"], ScanOptions(search_deps=False)):
+                print(hit)
+    """
+
+    def __init__(self, api_patterns=api_patterns, dependencies_info=dependencies_info, max_workers=None,
+                 pod_cache_max_bytes=POD_CACHE_MAX_BYTES):
+        self.api_patterns = api_patterns
+        self.dependencies_info = dependencies_info
+        self.pod_cache_max_bytes = pod_cache_max_bytes
+        # 預編譯正則表達式
+        # Precompile regular expressions
+        self.compiled_api_patterns = {key: [re.compile(pattern) for pattern in patterns] for key, patterns in api_patterns.items()}
+        self.compiled_dep_patterns_swift = {dep: re.compile(r'import\s+' + re.escape(dep)) for dep in dependencies_info.keys()}
+        self.compiled_dep_patterns_objc = {dep: re.compile(r'#import\s+["<]' + re.escape(dep) + r'[\./]') for dep in dependencies_info.keys()}
+        self.compiled_attracking_pattern = re.compile(r'ATTrackingManager.requestTrackingAuthorization')
+        # 組合正則，每個文件只需在整個緩衝區上各執行一次
+        # Combined patterns, each run once over the whole buffer of a file
+        self.combined_api_pattern = combine_patterns(p for patterns in self.compiled_api_patterns.values() for p in patterns)
+        self.combined_dep_pattern_swift = combine_patterns(self.compiled_dep_patterns_swift.values())
+        self.combined_dep_pattern_objc = combine_patterns(self.compiled_dep_patterns_objc.values())
+        # 規則集版本，規則變更後緩存的掃描結果即失效
+        # Rule-set version; cached scan results are invalidated when the rules change
+        self.ruleset_version = hashlib.blake2b(json.dumps(
+            [api_patterns, dependencies_info, self.compiled_attracking_pattern.pattern], sort_keys=True).encode('utf-8'),
+            digest_size=8).hexdigest()
+        self.max_workers = max_workers
+        self.executors = {}
+        self.executors_lock = threading.Lock()
+
+    def get_executor(self, workers=None):
+        """
+        Return the worker pool with the given number of threads, creating it on first use.
+        返回指定線程數的線程池，首次使用時創建。
+        """
+        workers = workers or self.max_workers or choose_worker_count(io_bound=False)
+        with self.executors_lock:
+            if workers not in self.executors:
+                self.executors[workers] = ThreadPoolExecutor(workers)
+            return self.executors[workers]
+
+    def close(self):
+        with self.executors_lock:
+            for executor in self.executors.values():
+                executor.shutdown(cancel_futures=True)
+            self.executors.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def walk_sources(self, directory, excluded_dirs, only_files=None, skip_dirs=()):
+        """
+        Yield (file_path, size) for the source files under a directory, skipping excluded directories.
+        With `only_files` (e.g. the files of an Xcode target), only those files are yielded instead of walking the tree.
+        Directories whose path is in `skip_dirs` (e.g. cached pods) are not entered.
+        列出目錄下的源文件及其大小並跳過排除的目錄；指定 only_files 時只返回這些文件，不遍歷目錄。
+        """
+        if only_files is not None:
+            excluded = set(excluded_dirs)
+            for file_path in only_files:
+                if not file_path.endswith(SOURCE_EXTENSIONS) or excluded.intersection(relative_path(file_path, directory).split('/')[:-1]):
+                    continue
+                # 項目中引用但已不存在的文件會被跳過
+                # Files the project references but that no longer exist on disk are skipped
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(file_stat.st_mode):
+                    yield file_path, file_stat.st_size
+            return
+
+        # 與 os.walk 相同的規則：不進入符號鏈接的目錄，但列出其中的文件大小
+        # Same rules as os.walk: symlinked directories are not descended into
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                entries = list(os.scandir(current))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if entry.name not in excluded_dirs and not entry.is_symlink() and entry.path not in skip_dirs:
+                            pending.append(entry.path)
+                    elif entry.name.endswith(SOURCE_EXTENSIONS):
+                        yield entry.path, entry.stat().st_size
+                except OSError:
+                    continue
+
+    def enumerate_files(self, paths, options, skip_dirs=()):
+        """
+        List the (file_path, search_api, size) entries to scan under the given project directories.
+        列出指定項目目錄下需要掃描的 (file_path, search_api, size)。
+        """
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        files_to_process = []
+        for directory in paths:
+            directory_files = []
+            api_files = set()
+            # 分別處理API搜索和套件搜索
+            if options.search_apis:
+                for file_path, size in self.walk_sources(directory, options.excluded_dirs_api, options.only_files, skip_dirs):
+                    api_files.add(file_path)
+                    directory_files.append((file_path, True, size))  # True表示這是API搜索
+
+            if options.search_deps:
+                for file_path, size in self.walk_sources(directory, options.excluded_dirs_deps, options.only_files, skip_dirs):
+                    # 確保在同時進行API和套件搜索時不重覆添加文件
+                    if file_path not in api_files:
+                        directory_files.append((file_path, False, size))  # False表示這是套件搜索
+
+            if options.shard is not None:
+                directory_files = [entry for entry in directory_files
+                                   if in_shard(relative_path(entry[0], directory), options.shard)]
+            files_to_process.extend(directory_files)
+        return files_to_process
+
+    def scan_file(self, file_path, is_api_search, search_deps, mask_literals=False, memo=None):
+        """
+        Scan one file and return its FileHits.
+        Each combined pattern runs once over the whole file; only lines with a match are checked
+        against the individual patterns, which gives the same hits as matching line by line.
+        With `mask_literals`, comments and string literals are ignored for API and ATTracking matching;
+        dependencies are still matched on the original text, since Objective-C imports are quoted.
+        With a ContentMemo, the hits of contents already scanned in the same run are reused.
+        掃描單個文件並返回 FileHits。組合正則在整個文件上各執行一次，只有匹配的行才逐個檢查原始正則，結果與逐行匹配相同。
+        啟用 mask_literals 時，API 與 ATTracking 匹配會忽略註釋與字符串字面量。傳入 ContentMemo 時，沿用同一次掃描中相同內容的結果。
+        """
+        api_lines = {}
+        deps = []
+        found_attracking = False
+        if file_path.endswith(SOURCE_EXTENSIONS):
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            if memo is not None:
+                key = (hashlib.blake2b(data, digest_size=16).digest(), is_api_search, file_path.endswith('.swift'))
+                file_hits = memo.get(key, len(data))
+                if file_hits is not None:
+                    return file_hits._replace(path=file_path)
+            text = data.decode('utf-8')
+            if '\r' in text:
+                # 與文本模式讀取相同的通用換行轉換
+                # The same universal-newline translation as reading in text mode
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            api_offsets = match_offsets(self.combined_api_pattern, text) if is_api_search else []
+            tracking_offsets = match_offsets(self.compiled_attracking_pattern, text) if search_deps else []
+            spans = None
+            # 只有原文有匹配時才需要詞法分析；落在註釋或字符串內的匹配會被丟棄
+            # Lexing is only needed when the original text has a match at all;
+            # matches inside comments or strings are then dropped
+            if mask_literals and (api_offsets or tracking_offsets):
+                spans = literal_spans(text, line_bounds(text, sorted(api_offsets + tracking_offsets)))
+                api_offsets = outside_spans(api_offsets, spans)
+                tracking_offsets = outside_spans(tracking_offsets, spans)
+            dep_offsets = []
+            if search_deps:
+                if file_path.endswith('.swift'):
+                    dep_patterns, combined_pattern = self.compiled_dep_patterns_swift, self.combined_dep_pattern_swift
+                else:
+                    dep_patterns, combined_pattern = self.compiled_dep_patterns_objc, self.combined_dep_pattern_objc
+                dep_offsets = match_offsets(combined_pattern, text)
+            # 換行索引每個文件只建立一次，供 API 與套件兩次查找共用
+            # The newline index is built once per file and shared by the API and dependency passes
+            newlines = newline_index(text) if api_offsets or dep_offsets else None
+            if is_api_search:
+                for line_number, line in candidate_lines(text, api_offsets, spans, newlines):
+                    for category, patterns in self.compiled_api_patterns.items():
                         for pattern in patterns:
                             if pattern.search(line):
-                                if category not in found_patterns:
-                                    found_patterns[category] = []
-                                found_patterns[category].append((file_path, i))
-                if search_deps:  # Dependency search check remains the same
-                    if file_path.endswith('.swift'):
-                        for dep, pattern in compiled_dep_patterns_swift.items():
-                            if pattern.search(line):
-                                found_deps.add(dep)
-                    elif file_path.endswith(('.h', '.m')):
-                        for dep, pattern in compiled_dep_patterns_objc.items():
-                            if pattern.search(line):
-                                found_deps.add(dep)
-                    if compiled_attracking_pattern.search(line):
-                        found_attracking = True
-    return found_patterns, found_deps, found_attracking
+                                if category not in api_lines:
+                                    api_lines[category] = array('I')
+                                api_lines[category].append(line_number)
+            if search_deps:
+                for _, line in candidate_lines(text, dep_offsets, newlines=newlines):
+                    for dep, pattern in dep_patterns.items():
+                        if dep not in deps and pattern.search(line):
+                            deps.append(dep)
+                # 該正則不會跨行匹配，可直接在整個文件上搜索
+                # The pattern cannot match across lines, so searching the whole buffer is equivalent
+                found_attracking = bool(tracking_offsets)
+            file_hits = FileHits(file_path, api_lines, tuple(deps), found_attracking)
+            if memo is not None:
+                memo.put(key, file_hits)
+            return file_hits
+        return FileHits(file_path, api_lines, tuple(deps), found_attracking)
+
+    def scan_batch(self, batch, search_deps, mask_literals=False, memo=None):
+        """
+        Scan a batch of (file_path, search_api) pairs and return (file_path, FileHits) for each file.
+        掃描一批文件，返回每個文件的 (file_path, FileHits)。
+        """
+        return [(file_path, self.scan_file(file_path, search_api, search_deps, mask_literals, memo))
+                for file_path, search_api in batch]
+
+    def plan_pods(self, directory, options):
+        """
+        Look up the CocoaPods of a project in the user-level cache.
+        Pods are keyed by (name, installed version and subspecs from Pods/Manifest.lock, rule-set version, scan options).
+        A pod whose version or subspecs in Podfile.lock differ from Manifest.lock (e.g. after a pull without
+        `pod install`) is not cached, since the files on disk are not what the lock file asks for.
+        在用戶級緩存中查找項目使用的 CocoaPods，鍵為 (名稱, Pods/Manifest.lock 中已安裝的版本與子規格, 規則集版本, 掃描選項)。
+        Podfile.lock 與 Manifest.lock 版本或子規格不一致的 pod（例如拉取代碼後未執行 pod install）不使用緩存。
+        """
+        if not options.pod_cache or options.only_files is not None:
+            return []
+        manifest_path = os.path.join(directory, 'Pods', 'Manifest.lock')
+        podfile_lock_path = os.path.join(directory, 'Podfile.lock')
+        if not os.path.isfile(manifest_path):
+            return []
+        try:
+            versions = parse_podfile_lock(manifest_path)
+            if os.path.isfile(podfile_lock_path):
+                wanted = parse_podfile_lock(podfile_lock_path)
+                versions = {name: installed for name, installed in versions.items() if wanted.get(name) == installed}
+        except (OSError, UnicodeDecodeError):
+            return []
+
+        scan_options = scan_options_key(options)
+        plans = []
+        for name, (version, subspecs) in sorted(versions.items()):
+            pod_dir = os.path.join(directory, 'Pods', name)
+            if not os.path.isdir(pod_dir):
+                continue
+            key = hashlib.blake2b(json.dumps([name, version, subspecs, self.ruleset_version, scan_options]).encode('utf-8'),
+                                  digest_size=16).hexdigest()
+            plans.append(PodPlan(directory, name, pod_dir, key, load_pod_cache_entry(key)))
+        return plans
+
+    def scan(self, paths, options=None, progress=None):
+        """
+        Scan one or more project directories and return a ScanRun that yields ApiHit,
+        DependencyHit and TrackingHit records as files finish.
+        `progress`, if given, is called with (files_processed, total_files).
+        掃描一個或多個項目目錄，返回一個 ScanRun，在文件掃描完成時逐個產出命中記錄。
+        """
+        options = options or ScanOptions()
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        pod_plans = [plan for directory in paths for plan in self.plan_pods(directory, options)]
+        # 分片運行只掃描部分 pod 文件，不寫入緩存
+        # Sharded runs only see part of each pod, so they read the cache but never write it
+        if options.shard is not None:
+            pod_plans = [plan for plan in pod_plans if plan.entry is not None]
+        skip_dirs = {plan.pod_dir for plan in pod_plans if plan.entry is not None}
+        return ScanRun(self, paths, self.enumerate_files(paths, options, skip_dirs), options, progress, pod_plans)
+
+    def write_report(self, output_txt_path, found_patterns, found_deps, search_deps, download_results=None):
+        """
+        Write the search results to a text report, including found API categories and dependencies.
+        With `download_results` from process_valid_dependencies, the modules that failed to download are listed.
+        將搜索結果寫入文本報告，包括找到的API類別和套件。傳入 download_results 時列出下載失敗的模塊。
+        """
+        with open(output_txt_path, 'w') as f:
+            f.write("Found API Categories:\n")
+            for category, occurrences in found_patterns.items():
+                f.write(f"- {category}\n")
+                for file_path, line in occurrences:
+                    f.write(f"  {os.path.basename(file_path)}: Line {line}\n")
+
+            if search_deps:
+                f.write("\nFound Dependencies:\n")
+                for dep in sorted(found_deps):
+                    f.write(f"\n- {dep}")
+                    if dep in self.dependencies_info:
+                        url_info = self.dependencies_info[dep]
+                        if url_info == "No":
+                            f.write(f"\n - No download link available\n")
+                        elif isinstance(url_info, str):
+                            f.write(f"\n - {url_info}\n")
+                        elif isinstance(url_info, dict):
+                            for key, url in url_info.items():
+                                f.write(f"\n  {key}: {url}\n")
+                    else:
+                        f.write(f"\n - Dependency information not found\n")
+
+            failures = [(dep, result) for dep, results in sorted((download_results or {}).items())
+                        for result in results if not result.ok]
+            if failures:
+                f.write("\nFailed Downloads 下載失敗:\n")
+                for dep, result in failures:
+                    module = f"{dep} ({result.key})" if result.key else dep
+                    f.write(f"- {module}: {result.error} after {result.attempts} attempt(s)\n  {result.url}\n")
+
+    def write_privacy_info(self, output_path, found_patterns, found_attracking):
+        """
+        Update or create a PrivacyInfo.xcprivacy file with all required API types.
+        使用所有必需的API類型更新或創建PrivacyInfo.xcprivacy文件。
+        """
+        try:
+            tree = ET.parse(output_path)
+            root = tree.getroot()
+        except FileNotFoundError:
+            root = ET.Element("plist", version="1.0")
+            dict_elem = ET.SubElement(root, "dict")
+        except ET.ParseError:
+            root = ET.Element("plist", version="1.0")
+            dict_elem = ET.SubElement(root, "dict")
+
+        dict_elem = root.find('.//dict')
+
+        # Remove existing NSPrivacyTracking if present
+        # 如果存在，則移除現有的NSPrivacyTracking。
+        #remove_ns_privacy_tracking_element(dict_elem)
+
+        # Ensure the NSPrivacyAccessedAPITypes key and its array are correctly structured
+        # 確保NSPrivacyAccessedAPITypes鍵及其數組結構正確。
+        if not dict_elem.find("key[@text='NSPrivacyAccessedAPITypes']"):
+            ET.SubElement(dict_elem, "key").text = "NSPrivacyAccessedAPITypes"
+            api_types_array = ET.SubElement(dict_elem, "array")
+        else:
+            api_types_array = dict_elem.find(".//array")
+
+        existing_api_types = set()
+        for api_type_dict in api_types_array.findall("dict"):
+            api_type_string = api_type_dict.find("string").text
+            existing_api_types.add(api_type_string)
+
+        for pattern in found_patterns:
+            if pattern not in existing_api_types:
+                new_dict = ET.SubElement(api_types_array, "dict")
+                ET.SubElement(new_dict, "key").text = "NSPrivacyAccessedAPIType"
+                ET.SubElement(new_dict, "string").text = pattern
+                reasons_key = ET.SubElement(new_dict, "key")
+                reasons_key.text = "NSPrivacyAccessedAPITypeReasons"
+                reasons_array = ET.SubElement(new_dict, "array")
+                reason_string = ET.SubElement(reasons_array, "string")
+                reason_string.text = "請在此處插入 " + pattern + " 原因"
 
+        # Re-add NSPrivacyTracking at the end with the correct value
+        # 在最後重新添加NSPrivacyTracking，並設置正確的值。
+        #ET.SubElement(dict_elem, "key").text = "NSPrivacyTracking"
+        #ET.SubElement(dict_elem, 'true' if found_attracking else 'false')
+
+        tree = ET.ElementTree(root)
+        tree.write(output_path, encoding="UTF-8", xml_declaration=True)
+
+
+_default_scanner = None
+
+
+def default_scanner():
+    """
+    Return the shared Scanner used by the module-level functions.
+    返回模塊級函數共用的 Scanner。
+    """
+    global _default_scanner
+    if _default_scanner is None:
+        _default_scanner = Scanner()
+    return _default_scanner
+
+
+def print_progress(files_processed, total_files):
+    # 更新進度
+    progress = (files_processed / total_files) * 100
+    sys.stdout.write(f"\rProgress: {progress:.2f}% ({files_processed}/{total_files})")
+    sys.stdout.flush()
+
+
+def scan_with_progress(scanner, directory, options):
+    """
+    Run a scan while printing progress, and return found_patterns, found_deps and the ATTracking status.
+    執行掃描並顯示進度，返回 found_patterns、found_deps 以及 ATTracking 狀態。
+    """
+    run = scanner.scan(directory, options, progress=print_progress)
+    found_patterns, found_deps, found_attracking = collect_hits(run)
+    print("\nDone processing files.")
+    if options.dedup:
+        print(f"Skipped {run.skipped_files} duplicate files ({run.skipped_bytes} bytes) 跳過 {run.skipped_files} 個重覆文件（{run.skipped_bytes} 字節）")
+    if run.cached_pods:
+        print(f"Reused cached results for {run.cached_pods} pods ({run.cached_files} files) 使用了 {run.cached_pods} 個 pod 的緩存結果（{run.cached_files} 個文件）")
+    return found_patterns, found_deps, found_attracking
 
 
-def search_files(directory, excluded_dirs_api, excluded_dirs_deps, search_apis, search_deps):
+def search_files(directory, excluded_dirs_api, excluded_dirs_deps, search_apis, search_deps, shard=None, dedup=True):
 
     """
     Search through the project directory for API usage and dependencies, excluding specified directories.
-    在項目目錄中搜索API使用情況和套件關係，排除指定的目錄。
+    When `shard` is an (index, count) tuple, only the files belonging to that shard are scanned.
+    With `dedup`, files with identical contents are scanned once and the hits are copied to every copy.
+    在項目目錄中搜索API使用情況和套件關係，排除指定的目錄。指定 shard 時只掃描該分片的文件。
+    啟用 dedup 時，內容相同的文件只掃描一次，結果套用到每個副本。
     """
 
-    files_to_process = []
+    options = ScanOptions(search_apis, search_deps, tuple(excluded_dirs_api), tuple(excluded_dirs_deps), shard, dedup)
+    return scan_with_progress(default_scanner(), directory, options)
+
+
+PARTIAL_RESULT_FORMAT = 2
+
+
+def write_partial_result(output_path, directory, shard, found_patterns, found_deps, found_attracking, search_deps, target=None,
+                         options=None, privacy_manifest=None):
+    """
+    Save the results of one shard as JSON so they can be merged later with the `merge` command.
+    Paths are stored relative to the project directory, together with the scan options that affect the results.
+    將單個分片的搜索結果保存為 JSON，供之後使用 merge 命令合併。路徑以項目目錄的相對路徑保存，並記錄影響結果的掃描選項。
+    """
+    partial = {
+        "format": PARTIAL_RESULT_FORMAT,
+        "shard": list(shard) if shard else [1, 1],
+        "search_deps": search_deps,
+        "scan_options": scan_options_key(options) if options else None,
+        "target": target,
+        "privacy_manifest": relative_path(privacy_manifest, directory) if privacy_manifest else None,
+        "found_attracking": found_attracking,
+        "found_deps": sorted(found_deps),
+        "found_patterns": {
+            category: [[relative_path(file_path, directory), line] for file_path, line in occurrences]
+            for category, occurrences in found_patterns.items()
+        },
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(partial, f, ensure_ascii=False, indent=1)
+
+
+def load_partial_result(partial_path):
+    """
+    Load a partial result written by `write_partial_result`.
+    讀取 write_partial_result 保存的分片結果。
+    """
+    with open(partial_path, 'r', encoding='utf-8') as f:
+        partial = json.load(f)
+    if partial.get("format") != PARTIAL_RESULT_FORMAT:
+        raise ValueError(f"{partial_path}: unsupported partial result format {partial.get('format')!r}")
+    return partial
+
+
+def merge_partial_results(directory, partials):
+    """
+    Combine partial results into found_patterns, found_deps, ATTracking status, the search_deps flag, the target
+    and the target's PrivacyInfo.xcprivacy path.
+    The merge is order-independent and checks that every shard 1..N is present exactly once
+    and that all shards were scanned with the same options.
+    合併分片結果，合併與順序無關，並檢查每個分片 1..N 恰好出現一次且所有分片使用相同的掃描選項。
+    """
+    if not partials:
+        raise ValueError("no partial results to merge")
+
+    counts = {partial["shard"][1] for partial in partials}
+    if len(counts) != 1:
+        raise ValueError(f"partial results come from different shard counts: {sorted(counts)}")
+    count = counts.pop()
+    indexes = sorted(partial["shard"][0] for partial in partials)
+    if indexes != list(range(1, count + 1)):
+        raise ValueError(f"expected shards 1..{count} exactly once, got {indexes}")
+
+    search_deps_flags = {partial["search_deps"] for partial in partials}
+    if len(search_deps_flags) != 1:
+        raise ValueError("partial results disagree on whether dependencies were searched")
+    scan_options = {json.dumps(partial.get("scan_options")) for partial in partials}
+    if len(scan_options) != 1:
+        raise ValueError("partial results were scanned with different options "
+                         "(API search, excluded directories or --mask-literals)")
+    targets = {partial.get("target") for partial in partials}
+    if len(targets) != 1:
+        raise ValueError("partial results come from different targets")
+
+    found_patterns = {}
+    found_deps = set()
     found_attracking = False
-    # 分別處理API搜索和套件搜索
-    if search_apis:
-        for root, dirs, files in os.walk(directory, topdown=True):
-            dirs[:] = [d for d in dirs if d not in excluded_dirs_api]
-            for file in files:
-                if file.endswith(('.swift', '.m', '.h')):
-                    file_path = os.path.join(root, file)
-                    files_to_process.append((file_path, True))  # True表示這是API搜索
+    for partial in partials:
+        for category, occurrences in partial["found_patterns"].items():
+            found_patterns.setdefault(category, []).extend(
+                (os.path.join(directory, *rel_path.split('/')), line) for rel_path, line in occurrences)
+        found_deps.update(partial["found_deps"])
+        found_attracking = found_attracking or partial["found_attracking"]
 
-    if search_deps:
-        for root, dirs, files in os.walk(directory, topdown=True):
-            dirs[:] = [d for d in dirs if d not in excluded_dirs_deps]
-            for file in files:
-                if file.endswith(('.swift', '.m', '.h')):
-                    file_path = os.path.join(root, file)
-                    # 確保在同時進行API和套件搜索時不重覆添加文件
-                    if not search_apis or (file_path, True) not in files_to_process:
-                        files_to_process.append((file_path, False))  # False表示這是套件搜索
-
-    total_files = len(files_to_process)
-    files_processed = 0
-
-    all_found_patterns = {}
-    all_found_deps = set()
-    search_tracking_auth_found = False
-
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_file, file_path, search_api, search_deps, found_attracking) for file_path, search_api in files_to_process]
-    for future in as_completed(futures):
-        files_processed += 1
-        found_patterns, found_deps, search_tracking_auth = future.result()
-        if search_tracking_auth:
-            search_tracking_auth_found = True
-        for category, occurrences in found_patterns.items():
-            if category not in all_found_patterns:
-                all_found_patterns[category] = occurrences
-            else:
-                all_found_patterns[category].extend(occurrences)
-        all_found_deps.update(found_deps)
-        # 更新進度
-        progress = (files_processed / total_files) * 100
-        sys.stdout.write(f"\rProgress: {progress:.2f}% ({files_processed}/{total_files})")
-        sys.stdout.flush()
+    privacy_manifest = partials[0].get("privacy_manifest")
+    if privacy_manifest:
+        privacy_manifest = os.path.join(directory, *privacy_manifest.split('/'))
+    return sort_found_patterns(found_patterns), found_deps, found_attracking, search_deps_flags.pop(), targets.pop(), privacy_manifest
+
+
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    project TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    search_deps INTEGER NOT NULL,
+    found_attracking INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_label ON scans (label, id);
+CREATE TABLE IF NOT EXISTS files (
+    scan_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    hits_digest TEXT NOT NULL,
+    PRIMARY KEY (scan_id, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hits (
+    scan_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    category TEXT NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hits_scan_path ON hits (scan_id, path);
+CREATE TABLE IF NOT EXISTS deps (
+    scan_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (scan_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS categories (
+    scan_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (scan_id, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS deltas (
+    scan_id INTEGER PRIMARY KEY,
+    baseline_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changed_files (
+    scan_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (scan_id, path)
+) WITHOUT ROWID;
+"""
+
+# 結果庫結構版本（PRAGMA user_version），用於升級舊的結果庫
+# Store schema version (PRAGMA user_version), used to upgrade older stores
+STORE_VERSION = 1
+
+
+def open_store(store_path):
+    """
+    Open (and create if needed) the SQLite baseline store.
+    打開（必要時創建）SQLite 基準結果庫。
+    """
+    connection = sqlite3.connect(store_path)
+    connection.executescript(STORE_SCHEMA)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        # 為升級前保存的掃描補充每個類別的命中數
+        # Fill in the per-category hit counts of scans saved before the categories table existed
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO categories (scan_id, category, hits) "
+                               "SELECT scan_id, category, COUNT(*) FROM hits GROUP BY scan_id, category")
+            connection.execute(f"PRAGMA user_version = {STORE_VERSION}")
+    return connection
+
+
+def record_scan(store_path, directory, found_patterns, found_deps, found_attracking, search_deps, label=None):
+    """
+    Save the results of a scan in the store and return its scan id.
+    Hits are stored per file with a digest of the file's hit list, so diffs only need to expand files that changed;
+    the hit count of each category is stored separately so diffs never read all hits of a scan.
+    The files whose hits differ from the previous scan of the same project are saved as the scan's delta.
+    將一次掃描結果保存到結果庫並返回掃描編號。每個文件保存命中列表的摘要，差異比較時只需展開有變化的文件；
+    每個類別的命中數另行保存，差異比較無需讀取一次掃描的全部命中。與同一項目上一次掃描相比有變化的文件另存為差量。
+    """
+    hits_by_path = {}
+    for category, occurrences in found_patterns.items():
+        for file_path, line in occurrences:
+            hits_by_path.setdefault(relative_path(file_path, directory), set()).add((category, line))
+
+    project = os.path.basename(os.path.normpath(directory))
+    with open_store(store_path) as connection:
+        previous = connection.execute("SELECT id FROM scans WHERE project = ? ORDER BY id DESC LIMIT 1", (project,)).fetchone()
+        cursor = connection.execute(
+            "INSERT INTO scans (label, project, created_at, search_deps, found_attracking) VALUES (?, ?, ?, ?, ?)",
+            (label, project, datetime.datetime.now().isoformat(timespec='seconds'), int(search_deps), int(found_attracking)))
+        scan_id = cursor.lastrowid
+        digests = {}
+        for path, hits in hits_by_path.items():
+            hits = sorted(hits)
+            hits_digest = digests[path] = hashlib.blake2b(repr(hits).encode('utf-8'), digest_size=16).hexdigest()
+            connection.execute("INSERT INTO files (scan_id, path, hits_digest) VALUES (?, ?, ?)", (scan_id, path, hits_digest))
+            connection.executemany("INSERT INTO hits (scan_id, path, category, line) VALUES (?, ?, ?, ?)",
+                                   [(scan_id, path, category, line) for category, line in hits])
+        connection.executemany("INSERT INTO deps (scan_id, name) VALUES (?, ?)", [(scan_id, dep) for dep in sorted(found_deps)])
+        category_hits = {}
+        for hits in hits_by_path.values():
+            for category, _ in hits:
+                category_hits[category] = category_hits.get(category, 0) + 1
+        connection.executemany("INSERT INTO categories (scan_id, category, hits) VALUES (?, ?, ?)",
+                               [(scan_id, category, count) for category, count in sorted(category_hits.items())])
+        if previous:
+            # 保存相對上一次掃描的差量，默認的 diff 只需讀取這些文件
+            # Save the delta against the previous scan, so the default diff only reads these files
+            previous_digests = dict(connection.execute("SELECT path, hits_digest FROM files WHERE scan_id = ?", previous))
+            changed = {path for path, hits_digest in digests.items() if previous_digests.get(path) != hits_digest}
+            changed.update(path for path in previous_digests if path not in digests)
+            connection.execute("INSERT INTO deltas (scan_id, baseline_id) VALUES (?, ?)", (scan_id, previous[0]))
+            connection.executemany("INSERT INTO changed_files (scan_id, path) VALUES (?, ?)",
+                                   [(scan_id, path) for path in sorted(changed)])
+    connection.close()
+    return scan_id
+
+
+def resolve_scan(connection, ref, before=None, project=None):
+    """
+    Resolve a scan reference (numeric id or label) to a scan id.
+    Without a reference, returns the latest scan (or the latest scan before `before`).
+    With `project`, labels and the default only match scans of that project.
+    將掃描引用（編號或標籤）解析為掃描編號；未指定時返回最新的掃描（或 before 之前的最新掃描）。
+    指定 project 時，標籤與默認值只匹配該項目的掃描。
+    """
+    project_filter = "" if project is None else " AND project = ?"
+    project_args = () if project is None else (project,)
+    if ref is None:
+        row = connection.execute(f"SELECT id FROM scans WHERE id < ?{project_filter} ORDER BY id DESC LIMIT 1",
+                                 (before if before is not None else sys.maxsize,) + project_args).fetchone()
+    elif ref.isdigit():
+        row = connection.execute("SELECT id FROM scans WHERE id = ?", (int(ref),)).fetchone()
+    else:
+        row = connection.execute(f"SELECT id FROM scans WHERE label = ?{project_filter} ORDER BY id DESC LIMIT 1",
+                                 (ref,) + project_args).fetchone()
+    if row is None:
+        raise ValueError(f"scan {ref!r} not found in store" if ref is not None else "not enough scans in store")
+    return row[0]
 
-    print("\nDone processing files.")
-    return all_found_patterns, all_found_deps, search_tracking_auth_found
 
+def diff_scans(store_path, baseline=None, current=None):
+    """
+    Compare two stored scans and return only what changed: API categories, hit locations, dependencies and ATTracking.
+    Only files whose hits changed are expanded. Against the default baseline (the previous scan of the same project)
+    they are read from the delta saved by record_scan, so the cost follows the size of the change set; other baselines
+    compare the file digests of both scans.
+    比較兩次已保存的掃描，只返回變化的部分：API類別、命中位置、套件以及 ATTracking 狀態。只展開命中有變化的文件：
+    基準為默認的上一次掃描時直接讀取 record_scan 保存的差量，其他基準則比較兩次掃描的文件摘要。
+    """
+    connection = open_store(store_path)
+    try:
+        current_id = resolve_scan(connection, current)
+        # 默認基準為同一項目的上一次掃描
+        # The default baseline is the previous scan of the same project
+        project = connection.execute("SELECT project FROM scans WHERE id = ?", (current_id,)).fetchone()[0]
+        baseline_id = resolve_scan(connection, baseline, before=current_id, project=project)
+
+        delta = connection.execute("SELECT baseline_id FROM deltas WHERE scan_id = ?", (current_id,)).fetchone()
+        if delta and delta[0] == baseline_id:
+            changed_paths = [row[0] for row in connection.execute("SELECT path FROM changed_files WHERE scan_id = ?", (current_id,))]
+        else:
+            changed_paths = [row[0] for row in connection.execute(
+                """SELECT a.path FROM files a WHERE a.scan_id = ? AND NOT EXISTS
+                       (SELECT 1 FROM files b WHERE b.scan_id = ? AND b.path = a.path AND b.hits_digest = a.hits_digest)
+                   UNION
+                   SELECT b.path FROM files b WHERE b.scan_id = ? AND NOT EXISTS
+                       (SELECT 1 FROM files a WHERE a.scan_id = ? AND a.path = b.path AND a.hits_digest = b.hits_digest)""",
+                (baseline_id, current_id, current_id, baseline_id))]
+
+        def changed_hits(scan_id):
+            hits = set()
+            for path in changed_paths:
+                hits.update((category, path, line) for category, line in connection.execute(
+                    "SELECT category, line FROM hits WHERE scan_id = ? AND path = ?", (scan_id, path)))
+            return hits
+
+        def categories(scan_id):
+            return {row[0] for row in connection.execute("SELECT category FROM categories WHERE scan_id = ?", (scan_id,))}
+
+        def deps(scan_id):
+            return {row[0] for row in connection.execute("SELECT name FROM deps WHERE scan_id = ?", (scan_id,))}
+
+        baseline_hits, current_hits = changed_hits(baseline_id), changed_hits(current_id)
+        baseline_categories, current_categories = categories(baseline_id), categories(current_id)
+        baseline_deps, current_deps = deps(baseline_id), deps(current_id)
+        attracking = dict(connection.execute("SELECT id, found_attracking FROM scans WHERE id IN (?, ?)",
+                                             (baseline_id, current_id)))
+    finally:
+        connection.close()
+
+    return {
+        "baseline": baseline_id,
+        "current": current_id,
+        "new_categories": sorted(current_categories - baseline_categories),
+        "removed_categories": sorted(baseline_categories - current_categories),
+        "new_hits": sorted(current_hits - baseline_hits),
+        "removed_hits": sorted(baseline_hits - current_hits),
+        "new_deps": sorted(current_deps - baseline_deps),
+        "removed_deps": sorted(baseline_deps - current_deps),
+        "attracking": (bool(attracking[baseline_id]), bool(attracking[current_id])),
+    }
+
+
+def write_diff_report(out, diff):
+    """
+    Write a scan diff in a format similar to the text report.
+    以類似文本報告的格式輸出掃描差異。
+    """
+    out.write(f"Diff of scan {diff['baseline']} -> {diff['current']}:\n")
+    sections = [
+        ("New API Categories", "+", diff["new_categories"]),
+        ("Removed API Categories", "-", diff["removed_categories"]),
+        ("New API Usage", "+", [f"{category} {path}: Line {line}" for category, path, line in diff["new_hits"]]),
+        ("Removed API Usage", "-", [f"{category} {path}: Line {line}" for category, path, line in diff["removed_hits"]]),
+        ("New Dependencies", "+", diff["new_deps"]),
+        ("Removed Dependencies", "-", diff["removed_deps"]),
+    ]
+    for title, sign, entries in sections:
+        if entries:
+            out.write(f"\n{title}:\n")
+            for entry in entries:
+                out.write(f"{sign} {entry}\n")
+    before, after = diff["attracking"]
+    if before != after:
+        out.write(f"\nATTracking authorization request: {before} -> {after}\n")
+
+
+# 內存映射索引：文件頭之後是按列存放的數組，查詢時只讀取需要的區段
+# Memory-mapped index: a header followed by columnar arrays; queries only touch the sections they need
+INDEX_MAGIC = b'PIDX'
+INDEX_FORMAT = 1
+INDEX_ALIGNMENT = 8
+
+# 索引中每個文件的狀態與命中，用於增量更新
+# State and hits of one indexed file, used for incremental updates
+IndexEntry = namedtuple('IndexEntry', ['mtime_ns', 'size', 'search_api', 'api_hits', 'deps', 'attracking'])
+
+
+def write_index(index_path, header, entries):
+    """
+    Write an index file from {relative path: IndexEntry}.
+    Paths get ids in sorted order; API hits are stored as (path_id, line) postings grouped by category,
+    and dependencies as path_id lists, each in one flat column. The file is replaced atomically,
+    so readers that still map the old file are not affected.
+    由 {相對路徑: IndexEntry} 寫入索引文件。路徑按排序分配編號；API 命中按類別分組保存為 (path_id, 行號) 倒排列表，
+    套件保存為 path_id 列表，均存放在扁平的列中。文件以原子方式替換，仍在映射舊文件的讀取者不受影響。
+    """
+    paths = sorted(entries)
+    path_offsets = array('I', [0])
+    path_data = bytearray()
+    mtimes = array('q')
+    sizes = array('Q')
+    flags = array('B')
+    postings = {}
+    dep_paths = {}
+    for path_id, path in enumerate(paths):
+        entry = entries[path]
+        path_data += path.encode('utf-8')
+        path_offsets.append(len(path_data))
+        mtimes.append(entry.mtime_ns)
+        sizes.append(entry.size)
+        flags.append(int(entry.search_api) | int(entry.attracking) << 1)
+        for category, line in sorted(entry.api_hits):
+            postings.setdefault(category, []).append((path_id, line))
+        for dep in entry.deps:
+            dep_paths.setdefault(dep, []).append(path_id)
+
+    posting_paths = array('I')
+    posting_lines = array('I')
+    categories = {}
+    for category in sorted(postings):
+        categories[category] = [len(posting_paths), len(postings[category])]
+        for path_id, line in postings[category]:
+            posting_paths.append(path_id)
+            posting_lines.append(line)
+    dep_path_column = array('I')
+    deps = {}
+    for dep in sorted(dep_paths):
+        deps[dep] = [len(dep_path_column), len(dep_paths[dep])]
+        dep_path_column.extend(dep_paths[dep])
+
+    columns = [
+        ("path_offsets", path_offsets.tobytes()),
+        ("path_data", bytes(path_data)),
+        ("mtime_ns", mtimes.tobytes()),
+        ("size", sizes.tobytes()),
+        ("flags", flags.tobytes()),
+        ("posting_path", posting_paths.tobytes()),
+        ("posting_line", posting_lines.tobytes()),
+        ("dep_path", dep_path_column.tobytes()),
+    ]
+    header = dict(header, byteorder=sys.byteorder, file_count=len(paths), categories=categories, deps=deps)
+
+    # 區段偏移寫在文件頭中，而文件頭的長度取決於偏移，因此重覆計算直到長度不再變化
+    # Section offsets live in the header whose length depends on them, so repeat until the length settles
+    header_length = 0
+    while True:
+        offset = 12 + header_length
+        sections = {}
+        for name, data in columns:
+            offset += -offset % INDEX_ALIGNMENT
+            sections[name] = [offset, len(data)]
+            offset += len(data)
+        encoded_header = json.dumps(dict(header, sections=sections), ensure_ascii=False).encode('utf-8')
+        if len(encoded_header) == header_length:
+            break
+        header_length = len(encoded_header)
+
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(struct.pack('<4sII', INDEX_MAGIC, INDEX_FORMAT, header_length))
+        f.write(encoded_header)
+        for name, data in columns:
+            f.write(b'\0' * (sections[name][0] - f.tell()))
+            f.write(data)
+    os.replace(temp_path, index_path)
+
+
+class PrivacyIndex:
+    """
+    Read-only view of an index file through mmap. Opening it only parses the small header;
+    each query reads just the slice of the columns it needs.
+    通過 mmap 讀取索引文件。打開時只解析很小的文件頭，每次查詢只讀取所需的列片段。
+
+        with PrivacyIndex("App/.privacy_index") as index:
+            for path, line in index.category_hits("NSPrivacyAccessedAPICategoryDiskSpace"):
+                print(path, line)
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{index_path}: empty index file")
+        try:
+            magic, version, header_length = struct.unpack_from('<4sII', self.data, 0)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{index_path}: not a privacy index")
+            if version != INDEX_FORMAT:
+                raise ValueError(f"{index_path}: unsupported index format {version!r}")
+            self.header = json.loads(self.data[12:12 + header_length].decode('utf-8'))
+            if self.header["byteorder"] != sys.byteorder:
+                raise ValueError(f"{index_path}: index was built on a machine with a different byte order")
+        except (struct.error, UnicodeDecodeError, json.JSONDecodeError, KeyError) as e:
+            self.data.close()
+            raise ValueError(f"{index_path}: corrupt index ({e})")
+        except ValueError:
+            self.data.close()
+            raise
+        self.sections = self.header["sections"]
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def column(self, name, typecode, start=0, count=None):
+        """
+        Read `count` items of a column from index `start` (the rest of the column by default).
+        從第 start 項開始讀取列中的 count 項（默認讀到列尾）。
+        """
+        offset, length = self.sections[name]
+        values = array(typecode)
+        if count is None:
+            count = length // values.itemsize - start
+        begin = offset + start * values.itemsize
+        values.frombytes(self.data[begin:begin + count * values.itemsize])
+        return values
+
+    def paths(self, path_ids):
+        """
+        Return the relative paths with the given ids, reading only their entries of the path columns.
+        返回指定編號的相對路徑，只讀取路徑列中對應的項。
+        """
+        data = self.data
+        offsets = self.sections["path_offsets"][0]
+        path_data = self.sections["path_data"][0]
+        unpack_from = struct.unpack_from
+        paths = []
+        for path_id in path_ids:
+            start, end = unpack_from('=II', data, offsets + 4 * path_id)
+            paths.append(data[path_data + start:path_data + end].decode('utf-8'))
+        return paths
+
+    def categories(self):
+        """
+        Return {category: number of hits}.
+        返回 {類別: 命中數}。
+        """
+        return {category: count for category, (_, count) in self.header["categories"].items()}
+
+    def dependencies(self):
+        """
+        Return {dependency: number of files importing it}.
+        返回 {套件: 引用它的文件數}。
+        """
+        return {dep: count for dep, (_, count) in self.header["deps"].items()}
+
+    def category_hits(self, category):
+        """
+        Return the (relative path, line) hits of an API category, sorted by path and line.
+        返回某個 API 類別的 (相對路徑, 行號) 命中，按路徑與行號排序。
+        """
+        start, count = self.header["categories"].get(category, (0, 0))
+        path_ids = self.column("posting_path", 'I', start, count)
+        lines = self.column("posting_line", 'I', start, count)
+        unique_ids = sorted(set(path_ids))
+        paths = dict(zip(unique_ids, self.paths(unique_ids)))
+        return [(paths[path_id], line) for path_id, line in zip(path_ids, lines)]
+
+    def dependency_paths(self, dep):
+        """
+        Return the sorted relative paths of the files importing a dependency.
+        返回引用某個套件的文件的相對路徑（已排序）。
+        """
+        start, count = self.header["deps"].get(dep, (0, 0))
+        return self.paths(self.column("dep_path", 'I', start, count))
+
+    def tracking_paths(self):
+        """
+        Return the relative paths of the files requesting ATTracking authorization.
+        返回請求 ATTracking 授權的文件的相對路徑。
+        """
+        return self.paths(path_id for path_id, flag in enumerate(self.column("flags", 'B')) if flag & 2)
+
+    def entries(self):
+        """
+        Load the whole index back into {relative path: IndexEntry}, for incremental updates.
+        將整個索引讀回 {相對路徑: IndexEntry}，用於增量更新。
+        """
+        path_offsets = self.column("path_offsets", 'I')
+        offset, length = self.sections["path_data"]
+        path_data = self.data[offset:offset + length]
+        paths = [path_data[path_offsets[i]:path_offsets[i + 1]].decode('utf-8') for i in range(len(path_offsets) - 1)]
+        api_hits = [[] for _ in paths]
+        deps = [[] for _ in paths]
+        for category, (start, count) in self.header["categories"].items():
+            for path_id, line in zip(self.column("posting_path", 'I', start, count), self.column("posting_line", 'I', start, count)):
+                api_hits[path_id].append((category, line))
+        for dep, (start, count) in self.header["deps"].items():
+            for path_id in self.column("dep_path", 'I', start, count):
+                deps[path_id].append(dep)
+        return {path: IndexEntry(mtime_ns, size, bool(flag & 1), api_hits[path_id], deps[path_id], bool(flag & 2))
+                for path_id, (path, mtime_ns, size, flag) in enumerate(zip(paths, self.column("mtime_ns", 'q'),
+                                                                           self.column("size", 'Q'), self.column("flags", 'B')))}
+
+
+def update_index(scanner, directory, index_path, options, progress=None):
+    """
+    Build or incrementally update the index of a project directory.
+    Files whose modification time, size and search mode match the existing index keep their entries;
+    only new and changed files are scanned, and deleted files are dropped. A change of rules or scan
+    options rebuilds the index from scratch. Returns (files scanned, files reused, files removed).
+    建立或增量更新項目目錄的索引。修改時間、大小與搜索模式未變的文件沿用原有記錄，只掃描新增和修改的文件，
+    並移除已刪除的文件；規則或掃描選項變化時重新建立整個索引。返回 (掃描的文件數, 沿用的文件數, 移除的文件數)。
+    """
+    scan_options = scan_options_key(options)
+    previous = {}
+    if os.path.exists(index_path):
+        try:
+            with PrivacyIndex(index_path) as index:
+                if index.header["ruleset_version"] == scanner.ruleset_version and index.header["options"] == scan_options:
+                    previous = index.entries()
+        except (OSError, ValueError, KeyError):
+            previous = {}
+
+    entries = {}
+    relative_paths = {}
+    changed_files = []
+    for file_path, search_api, size in scanner.enumerate_files(directory, options):
+        path = relative_paths[file_path] = relative_path(file_path, directory)
+        # 在掃描前取得修改時間，掃描期間的修改會在下次更新時被發現
+        # The modification time is taken before scanning, so edits made during the scan are picked up next time
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        entry = previous.get(path)
+        if entry is not None and (entry.mtime_ns, entry.size, entry.search_api) == (mtime_ns, size, search_api):
+            entries[path] = entry
+        else:
+            entries[path] = IndexEntry(mtime_ns, size, search_api, [], [], False)
+            changed_files.append((file_path, search_api, size))
+
+    if changed_files:
+        for hit in ScanRun(scanner, [directory], changed_files, options, progress):
+            path = relative_paths[hit.path]
+            if isinstance(hit, ApiHit):
+                entries[path].api_hits.append((hit.category, hit.line))
+            elif isinstance(hit, DependencyHit):
+                entries[path].deps.append(hit.name)
+            elif isinstance(hit, TrackingHit):
+                entries[path] = entries[path]._replace(attracking=True)
+
+    header = {
+        "project": os.path.basename(os.path.normpath(directory)),
+        "built_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        "ruleset_version": scanner.ruleset_version,
+        "options": scan_options,
+    }
+    write_index(index_path, header, entries)
+    removed = sum(1 for path in previous if path not in entries)
+    return len(changed_files), len(entries) - len(changed_files), removed
 
 
 # 將搜索結果寫入文本報告
-def write_txt_report(output_txt_path, found_patterns, found_deps, search_deps):
-
-    """
-    Write the search results to a text report, including found API categories and dependencies.
-    將搜索結果寫入文本報告，包括找到的API類別和套件。
-    """
-
-    with open(output_txt_path, 'w') as f:
-        f.write("Found API Categories:\n")
-        for category, occurrences in found_patterns.items():
-            f.write(f"- {category}\n")
-            for file_path, line in occurrences:
-                f.write(f"  {os.path.basename(file_path)}: Line {line}\n")
-
-        if search_deps:
-            f.write("\nFound Dependencies:\n")
-            for dep in found_deps:
-                f.write(f"\n- {dep}")
-                if dep in dependencies_info:
-                    url_info = dependencies_info[dep]
-                    if url_info == "No":
-                        f.write(f"\n - No download link available\n")
-                    elif isinstance(url_info, str):
-                        f.write(f"\n - {url_info}\n")
-                    elif isinstance(url_info, dict):
-                        for key, url in url_info.items():
-                            f.write(f"\n  {key}: {url}\n")
-                else:
-                    f.write(f"\n - Dependency information not found\n")
+def write_txt_report(output_txt_path, found_patterns, found_deps, search_deps, download_results=None):
+
+    """
+    Write the search results to a text report, including found API categories, dependencies and failed downloads.
+    將搜索結果寫入文本報告，包括找到的API類別、套件以及下載失敗的文件。
+    """
+
+    default_scanner().write_report(output_txt_path, found_patterns, found_deps, search_deps, download_results)
+
 
 def remove_ns_privacy_tracking_element(dict_elem):
     children = list(dict_elem)
@@ -320,53 +2283,7 @@ def update_privacy_info(output_path, found_patterns, found_attracking):
     Update or create a PrivacyInfo.xcprivacy file with all required API types.
     使用所有必需的API類型更新或創建PrivacyInfo.xcprivacy文件。
     """
-    try:
-        tree = ET.parse(output_path)
-        root = tree.getroot()
-    except FileNotFoundError:
-        root = ET.Element("plist", version="1.0")
-        dict_elem = ET.SubElement(root, "dict")
-    except ET.ParseError:
-        root = ET.Element("plist", version="1.0")
-        dict_elem = ET.SubElement(root, "dict")
-
-    dict_elem = root.find('.//dict')
-
-    # Remove existing NSPrivacyTracking if present
-    # 如果存在，則移除現有的NSPrivacyTracking。
-    #remove_ns_privacy_tracking_element(dict_elem)
-
-    # Ensure the NSPrivacyAccessedAPITypes key and its array are correctly structured
-    # 確保NSPrivacyAccessedAPITypes鍵及其數組結構正確。
-    if not dict_elem.find("key[@text='NSPrivacyAccessedAPITypes']"):
-        ET.SubElement(dict_elem, "key").text = "NSPrivacyAccessedAPITypes"
-        api_types_array = ET.SubElement(dict_elem, "array")
-    else:
-        api_types_array = dict_elem.find(".//array")
-
-    existing_api_types = set()
-    for api_type_dict in api_types_array.findall("dict"):
-        api_type_string = api_type_dict.find("string").text
-        existing_api_types.add(api_type_string)
-
-    for pattern in found_patterns:
-        if pattern not in existing_api_types:
-            new_dict = ET.SubElement(api_types_array, "dict")
-            ET.SubElement(new_dict, "key").text = "NSPrivacyAccessedAPIType"
-            ET.SubElement(new_dict, "string").text = pattern
-            reasons_key = ET.SubElement(new_dict, "key")
-            reasons_key.text = "NSPrivacyAccessedAPITypeReasons"
-            reasons_array = ET.SubElement(new_dict, "array")
-            reason_string = ET.SubElement(reasons_array, "string")
-            reason_string.text = "請在此處插入 " + pattern + " 原因"
-
-    # Re-add NSPrivacyTracking at the end with the correct value
-    # 在最後重新添加NSPrivacyTracking，並設置正確的值。
-    #ET.SubElement(dict_elem, "key").text = "NSPrivacyTracking"
-    #ET.SubElement(dict_elem, 'true' if found_attracking else 'false')
-
-    tree = ET.ElementTree(root)
-    tree.write(output_path, encoding="UTF-8", xml_declaration=True)
+    default_scanner().write_privacy_info(output_path, found_patterns, found_attracking)
 
 
 def filter_valid_dependencies(found_deps):
@@ -395,23 +2312,365 @@ def filter_valid_dependencies(found_deps):
 
 def process_valid_dependencies(valid_deps, base_dir):
     """
-    Process and download each valid dependency.
-    處理並下載每個有效的套件。
+    Process and download each valid dependency, returning {dependency: [DownloadResult, ...]}.
+    處理並下載每個有效的套件，返回每個套件的下載結果。
     """
+    download_results = {}
     for dep, url_info in valid_deps.items():
         print(f"Processing dependency: {dep}")
-        process_dependency(dep, url_info, base_dir)
+        download_results[dep] = process_dependency(dep, url_info, base_dir)
+    return download_results
+
+def output_paths(directory, target=None, privacy_manifest=None):
+    """
+    Return the PrivacyInfo.xcprivacy path and the dated report path for a project directory.
+    For an Xcode target, the report is named after the target and the results go into the target's own
+    PrivacyInfo.xcprivacy (see target_privacy_manifest). A target without one gets <target>_PrivacyInfo.xcprivacy,
+    so targets never share a file.
+    返回項目目錄下 PrivacyInfo.xcprivacy 與帶日期報告文件的路徑。指定 target 時，報告以 target 命名，結果寫入該 target
+    自己的 PrivacyInfo.xcprivacy；target 沒有該文件時寫入 <target>_PrivacyInfo.xcprivacy，不同 target 不會共用同一個文件。
+    """
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    project_name = target or os.path.basename(os.path.normpath(directory))
+    if privacy_manifest:
+        output_path = privacy_manifest
+    elif target:
+        output_path = os.path.join(directory, f"{target}_PrivacyInfo.xcprivacy")
+    else:
+        output_path = os.path.join(directory, "PrivacyInfo.xcprivacy")
+    output_txt_path = os.path.join(directory, f"{project_name}_{current_date}.txt")
+    return output_path, output_txt_path
+
+
+def find_xcodeproj(directory):
+    """
+    Return the only .xcodeproj in a directory, or raise ValueError if there is none or several.
+    返回目錄中唯一的 .xcodeproj，沒有或多於一個時拋出 ValueError。
+    """
+    projects = sorted(name for name in os.listdir(directory) if name.endswith('.xcodeproj'))
+    if len(projects) != 1:
+        raise ValueError(f"expected one .xcodeproj in {directory}, found {len(projects)}; use --xcodeproj")
+    return os.path.join(directory, projects[0])
+
+
+def resolve_targets(parser, args, directory):
+    """
+    Turn --xcodeproj/--target/--list-targets into a list of (target name, files, PrivacyInfo.xcprivacy path) tuples.
+    Without --target the whole directory is scanned: [(None, None, None)].
+    將 --xcodeproj/--target/--list-targets 參數轉換為 (target 名稱, 文件列表, PrivacyInfo.xcprivacy 路徑) 列表。
+    """
+    if not args.targets and not args.list_targets:
+        return [(None, None, None)]
+    try:
+        xcodeproj = args.xcodeproj or find_xcodeproj(directory)
+        if args.list_targets:
+            for name in sorted(load_xcode_project(xcodeproj)["targets"]):
+                print(f"{name}: {len(target_files(xcodeproj, name))} files")
+            parser.exit()
+        return [(target, target_files(xcodeproj, target), target_privacy_manifest(xcodeproj, target))
+                for target in args.targets]
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+
+def merge_main(argv):
+    """
+    `merge` command: combine shard results, then update PrivacyInfo.xcprivacy and write the report.
+    merge 命令：合併分片結果，然後更新 PrivacyInfo.xcprivacy 並生成報告。
+    """
+    parser = argparse.ArgumentParser(prog='update_privacy_info.py merge',
+                                     description='Merge partial results produced with --shard.')
+    parser.add_argument('directory', help='Project directory path')
+    parser.add_argument('partials', nargs='+', help='Partial result files written by --shard runs')
+    parser.add_argument('--store', metavar='PATH', help='Also save the merged results in this result store')
+    parser.add_argument('--label', help='Label for the scan saved with --store, e.g. a branch or commit')
+    args = parser.parse_args(argv)
+
+    try:
+        partials = [load_partial_result(partial_path) for partial_path in args.partials]
+        found_patterns, found_deps, search_tracking_auth, search_deps, target, privacy_manifest = merge_partial_results(args.directory, partials)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+
+    output_path, output_txt_path = output_paths(args.directory, target, privacy_manifest)
+    update_privacy_info(output_path, found_patterns, search_tracking_auth)
+    write_txt_report(output_txt_path, found_patterns, found_deps, search_deps)
+    if args.store:
+        scan_id = record_scan(args.store, args.directory, found_patterns, found_deps, search_tracking_auth, search_deps, args.label)
+        print(f"Scan {scan_id} has been saved in 掃描結果已保存至 {args.store}")
+
+    print(f"PrivacyInfo.xcprivacy file has been updated at 文件已更新，位於 {output_path}")
+    print(f"Report file has been saved at 報告文件已保存至 {output_txt_path}")
+
+
+def diff_main(argv):
+    """
+    `diff` command: report what changed between two scans saved with --store.
+    diff 命令：比較兩次使用 --store 保存的掃描結果。
+    """
+    parser = argparse.ArgumentParser(prog='update_privacy_info.py diff',
+                                     description='Show new or removed API usage and dependencies between two stored scans.')
+    parser.add_argument('store', help='Result store written with --store')
+    parser.add_argument('--baseline', help='Baseline scan id or label (default: the previous scan of the same project as --current)')
+    parser.add_argument('--current', help='Scan id or label to compare (default: the latest scan)')
+    parser.add_argument('--fail-on-new', action='store_true',
+                        help='Exit with status 1 if new API categories, usage or dependencies were found')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        parser.error(f"store {args.store} does not exist")
+    try:
+        diff = diff_scans(args.store, args.baseline, args.current)
+    except ValueError as e:
+        parser.error(str(e))
+
+    write_diff_report(sys.stdout, diff)
+    if args.fail_on_new and (diff["new_categories"] or diff["new_hits"] or diff["new_deps"]
+                             or diff["attracking"] == (False, True)):
+        return 1
+
+
+def index_main(argv):
+    """
+    `index` command: build or incrementally update the memory-mapped index of a project directory.
+    index 命令：建立或增量更新項目目錄的內存映射索引。
+    """
+    parser = argparse.ArgumentParser(prog='update_privacy_info.py index',
+                                     description='Build or incrementally update an index of API hits for the query command.')
+    parser.add_argument('directory', help='Project directory path')
+    parser.add_argument('--output', metavar='PATH', help='Index file (default: .privacy_index in the project directory)')
+    parser.add_argument('--no-apis', dest='search_apis', action='store_false', help='Do not search for API usage')
+    parser.add_argument('--no-deps', dest='search_deps', action='store_false', help='Do not search for dependencies')
+    parser.add_argument('--exclude-api', nargs='+', default=[], metavar='DIR', help='Directories to exclude for API search')
+    parser.add_argument('--exclude-deps', nargs='+', default=[], metavar='DIR', help='Directories to exclude for dependencies search')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help='Scan every file even if another file has identical contents')
+    parser.add_argument('--mask-literals', action='store_true',
+                        help='Ignore API names that only appear in comments and string literals')
+    parser.add_argument('--jobs', type=int, metavar='N', help='Number of worker threads')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        parser.error(f"directory {args.directory} does not exist")
+
+    index_path = args.output or os.path.join(args.directory, '.privacy_index')
+    options = ScanOptions(args.search_apis, args.search_deps, tuple(args.exclude_api), tuple(args.exclude_deps),
+                          dedup=args.dedup, mask_literals=args.mask_literals)
+    start = time.perf_counter()
+    with Scanner(max_workers=args.jobs) as scanner:
+        scanned, reused, removed = update_index(scanner, args.directory, index_path, options, print_progress)
+    if scanned:
+        print()
+    print(f"Index has been saved at 索引已保存至 {index_path}: {scanned} files scanned, {reused} reused, {removed} removed "
+          f"(掃描 {scanned} 個文件，沿用 {reused} 個，移除 {removed} 個) in {time.perf_counter() - start:.2f}s")
+
+
+def query_main(argv):
+    """
+    `query` command: answer questions such as "which files use DiskSpace APIs?" from an index without rescanning.
+    query 命令：無需重新掃描，直接從索引回答例如「哪些文件使用了 DiskSpace API？」的問題。
+    """
+    parser = argparse.ArgumentParser(prog='update_privacy_info.py query',
+                                     description='Query an index written by the index command.')
+    parser.add_argument('index', help='Index file written by the index command')
+    question = parser.add_mutually_exclusive_group(required=True)
+    question.add_argument('--category', metavar='NAME',
+                          help='List the hits of an API category, e.g. DiskSpace or NSPrivacyAccessedAPICategoryDiskSpace')
+    question.add_argument('--dep', metavar='NAME', help='List the files importing a dependency')
+    question.add_argument('--tracking', action='store_true', help='List the files requesting ATTracking authorization')
+    question.add_argument('--summary', action='store_true', help='Show the number of hits per category and files per dependency')
+    parser.add_argument('--json', action='store_true', help='Print the answer as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        index = PrivacyIndex(args.index)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    with index:
+        if args.category:
+            category = args.category
+            if category not in index.header["categories"] and not category.startswith('NSPrivacyAccessedAPICategory'):
+                category = 'NSPrivacyAccessedAPICategory' + category
+            hits = index.category_hits(category)
+            answer = [{"path": path, "line": line} for path, line in hits]
+            lines = [f"{path}: Line {line}" for path, line in hits]
+        elif args.dep:
+            answer = index.dependency_paths(args.dep)
+            lines = answer
+        elif args.tracking:
+            answer = index.tracking_paths()
+            lines = answer
+        else:
+            answer = {"files": index.header["file_count"], "categories": index.categories(), "deps": index.dependencies()}
+            lines = [f"Indexed files: {answer['files']}", "API Categories:"]
+            lines += [f"- {category}: {count}" for category, count in answer["categories"].items()]
+            lines += ["Dependencies:"] + [f"- {dep}: {count}" for dep, count in answer["deps"].items()]
+
+    if args.json:
+        print(json.dumps(answer, ensure_ascii=False))
+    else:
+        for line in lines:
+            print(line)
+
+
+def run_scan(scanner, directory, options, download_privacy_info=False, partial_output=None, store=None, label=None, target=None,
+             privacy_manifest=None):
+    """
+    Scan one project directory and write its outputs: PrivacyInfo.xcprivacy, the report and optionally
+    the downloaded dependency manifests and a store entry. Sharded runs only write their partial result.
+    掃描一個項目目錄並生成輸出：PrivacyInfo.xcprivacy、報告，以及可選的套件文件下載和結果庫記錄。分片運行只保存部分結果。
+    """
+    # Execute file search, then update PrivacyInfo.xcprivacy file and generate report
+    found_patterns, found_deps, search_tracking_auth = scan_with_progress(scanner, directory, options)
+
+    if options.shard:
+        # Sharded runs only save their partial result; `merge` produces the final files
+        # 分片運行只保存部分結果，最終文件由 merge 命令生成
+        index, count = options.shard
+        project_name = target or os.path.basename(os.path.normpath(directory))
+        partial_path = partial_output or os.path.join(directory, f"{project_name}_shard{index}of{count}.json")
+        write_partial_result(partial_path, directory, options.shard, found_patterns, found_deps, search_tracking_auth, options.search_deps, target, options,
+                             privacy_manifest)
+        print(f"Partial result for shard {index}/{count} has been saved at 分片結果已保存至 {partial_path}")
+        return
+
+    # Update PrivacyInfo.xcprivacy and generate the report
+    output_path, output_txt_path = output_paths(directory, target, privacy_manifest)
+
+    scanner.write_privacy_info(output_path, found_patterns, search_tracking_auth)
+
+    if download_privacy_info:
+        # Filter and process valid dependencies
+        base_dir = os.path.join(directory, "Deps_PrivacyInfos")  # Directory to save downloaded files
+        os.makedirs(base_dir, exist_ok=True)  # Ensure the base directory exists
+        valid_deps = filter_valid_dependencies(found_deps)
+        download_results = process_valid_dependencies(valid_deps, base_dir)
+    else:
+        download_results = None
+
+    scanner.write_report(output_txt_path, found_patterns, found_deps, options.search_deps, download_results)
+    if store:
+        scan_id = record_scan(store, directory, found_patterns, found_deps, search_tracking_auth, options.search_deps, label)
+        print(f"Scan {scan_id} has been saved in 掃描結果已保存至 {store}")
+
+    print(f"PrivacyInfo.xcprivacy file has been updated at 文件已更新，位於 {output_path}")
+    print(f"Report file has been saved at 報告文件已保存至 {output_txt_path}")
+
+
+def add_common_arguments(parser):
+    """
+    Add the options shared by the interactive and the non-interactive command line.
+    添加互動式與非互動式命令行共用的參數。
+    """
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='Only scan shard i of N and write a partial result for the merge command')
+    parser.add_argument('--partial-output', metavar='PATH',
+                        help='Where to write the partial result of a --shard run '
+                             '(default: <project>_shard<i>of<N>.json in the project directory)')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help='Scan every file even if another file has identical contents')
+    parser.add_argument('--store', metavar='PATH', help='Also save the results in this result store for the diff command')
+    parser.add_argument('--label', help='Label for the scan saved with --store, e.g. a branch or commit')
+    parser.add_argument('--xcodeproj', metavar='PATH',
+                        help='Xcode project used by --target (default: the only .xcodeproj in the directory)')
+    parser.add_argument('--target', dest='targets', action='append', default=[], metavar='NAME',
+                        help='Only scan the files in the Sources and Headers build phases of this target; '
+                             'may be repeated to produce one result per target')
+    parser.add_argument('--list-targets', action='store_true', help='List the targets of the Xcode project and exit')
+    parser.add_argument('--mask-literals', action='store_true',
+                        help='Ignore API names that only appear in comments and string literals')
+    parser.add_argument('--no-pod-cache', dest='pod_cache', action='store_false',
+                        help='Do not reuse or save cached results for CocoaPods listed in Podfile.lock')
+    parser.add_argument('--pod-cache-size', type=int, default=POD_CACHE_MAX_BYTES // (1024 * 1024), metavar='MB',
+                        help='Size limit of the user-level pod result cache; least recently used entries are evicted '
+                             '(default: %(default)s)')
+
+
+def check_shard_arguments(parser, args):
+    """
+    Reject options that a --shard run would silently ignore: shards only write partial results.
+    拒絕分片運行會忽略的參數：分片只保存部分結果。
+    """
+    if args.shard and (args.store or args.label):
+        parser.error("--store/--label cannot be used with --shard; save the merged result with `merge --store`")
+
+
+def scan_main(argv):
+    """
+    `scan` command: non-interactive scan of one or more project directories with a single Scanner.
+    scan 命令：以單個 Scanner 非互動地掃描一個或多個項目目錄。
+    """
+    parser = argparse.ArgumentParser(prog='update_privacy_info.py scan',
+                                     description='Scan project directories without interactive prompts.')
+    parser.add_argument('directories', nargs='+', help='Project directory paths')
+    parser.add_argument('--no-apis', dest='search_apis', action='store_false', help='Do not search for API usage')
+    parser.add_argument('--no-deps', dest='search_deps', action='store_false', help='Do not search for dependencies')
+    parser.add_argument('--exclude-api', nargs='+', default=[], metavar='DIR', help='Directories to exclude for API search')
+    parser.add_argument('--exclude-deps', nargs='+', default=[], metavar='DIR', help='Directories to exclude for dependencies search')
+    parser.add_argument('--download', action='store_true', help='Download privacy_info for found dependencies')
+    parser.add_argument('--jobs', type=int, metavar='N', help='Number of worker threads')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='Stream hit records to stdout as JSON lines instead of writing the report files; '
+                             'paths are relative to the project directory')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    check_shard_arguments(parser, args)
+    if args.partial_output and (len(args.directories) > 1 or len(args.targets) > 1):
+        parser.error("--partial-output can only be used with a single directory and target")
+    if args.jsonl:
+        # --jsonl 只輸出命中記錄，不會生成這些選項所需的文件
+        # --jsonl only streams hit records, so it never writes what these options ask for
+        conflicting = [flag for flag, value in (('--store', args.store), ('--download', args.download),
+                                                ('--shard', args.shard), ('--partial-output', args.partial_output)) if value]
+        if conflicting:
+            parser.error(f"--jsonl cannot be combined with {', '.join(conflicting)}")
+
+    options = ScanOptions(args.search_apis, args.search_deps, tuple(args.exclude_api), tuple(args.exclude_deps),
+                          args.shard, args.dedup, pod_cache=args.pod_cache, mask_literals=args.mask_literals)
+    with Scanner(max_workers=args.jobs, pod_cache_max_bytes=args.pod_cache_size * 1024 * 1024) as scanner:
+        for directory in args.directories:
+            for target, files, privacy_manifest in resolve_targets(parser, args, directory):
+                target_options = options._replace(only_files=files)
+                if args.jsonl:
+                    project = os.path.basename(os.path.abspath(directory))
+                    for hit in scanner.scan(directory, target_options):
+                        record = {"type": type(hit).__name__, "project": project, "target": target, **hit._asdict()}
+                        record["path"] = relative_path(hit.path, directory)
+                        print(json.dumps(record, ensure_ascii=False))
+                else:
+                    run_scan(scanner, directory, target_options, args.download and not args.shard,
+                             args.partial_output, args.store, args.label, target, privacy_manifest)
+
+
+# 子命令，例如 `update_privacy_info.py merge ...`
+# Subcommands, e.g. `update_privacy_info.py merge ...`
+subcommands = {
+    "scan": scan_main,
+    "merge": merge_main,
+    "diff": diff_main,
+    "index": index_main,
+    "query": query_main,
+}
+
 
 def main():
-    parser = argparse.ArgumentParser(description='Scan project directory for API usage and dependencies.')
+    if len(sys.argv) > 1 and sys.argv[1] in subcommands:
+        return subcommands[sys.argv[1]](sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='Scan project directory for API usage and dependencies. '
+                                                 'Use the scan command for a non-interactive run.')
     parser.add_argument('directory', help='Project directory path')
+    add_common_arguments(parser)
     args = parser.parse_args()
+    check_shard_arguments(parser, args)
+    if args.partial_output and len(args.targets) > 1:
+        parser.error("--partial-output can only be used with a single target")
+    targets = resolve_targets(parser, args, args.directory)
 
     # 從用戶獲取輸入，如是否搜索套件，是否排除特定目錄等
     search_apis = user_input("Do you want to search for API usage 是否要搜索API使用情況 (y/n): ").lower() == 'y'
+    excluded_dirs_api = []
     if search_apis:
         exclude_dirs_api_choice = user_input("Do you want to exclude certain directories for API search 您是否要為API搜索排除某些目錄 (y/n): ").lower() == 'y'
-        excluded_dirs_api = []
         if exclude_dirs_api_choice:
             excluded_dirs_api = user_input("Please enter directories to exclude for API search (separated by space) 請為API搜索輸入要排除的目錄（用空格分隔）: ").split()
     
@@ -425,36 +2684,18 @@ def main():
         else:
             excluded_dirs_deps = []
 
-        download_privacy_info = user_input("Do you want to download privacy_info for dependencies 是否要下載套件的 privacy_info (y/n): ").lower() == 'y'
+        # 分片運行只產出部分結果，下載留給合併後的完整運行
+        download_privacy_info = not args.shard and user_input("Do you want to download privacy_info for dependencies 是否要下載套件的 privacy_info (y/n): ").lower() == 'y'
     else:
         excluded_dirs_deps = []
         download_privacy_info = False
 
-    # Execute file search, then update PrivacyInfo.xcprivacy file and generate report
-    found_patterns, found_deps, search_tracking_auth = search_files(args.directory, excluded_dirs_api, excluded_dirs_deps, search_apis, search_deps)
-    
-    # Update PrivacyInfo.xcprivacy and generate the report
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    project_name = os.path.basename(os.path.normpath(args.directory))
-    output_path = os.path.join(args.directory, f"PrivacyInfo.xcprivacy")
-    output_txt_path = os.path.join(args.directory, f"{project_name}_{current_date}.txt")
-
-    update_privacy_info(output_path, found_patterns, search_tracking_auth)
-
-    if download_privacy_info:
-        # Filter and process valid dependencies
-        base_dir = os.path.join(args.directory, "Deps_PrivacyInfos")  # Directory to save downloaded files
-        os.makedirs(base_dir, exist_ok=True)  # Ensure the base directory exists
-        valid_deps = filter_valid_dependencies(found_deps)
-        process_valid_dependencies(valid_deps, base_dir)
-
-    write_txt_report(output_txt_path, found_patterns, found_deps, search_deps)
-
-    print(f"PrivacyInfo.xcprivacy file has been updated at 文件已更新，位於 {output_path}")
-    print(f"Report file has been saved at 報告文件已保存至 {output_txt_path}")
-
-    print(f"PrivacyInfo.xcprivacy file has been updated at 文件已更新，位於{output_path}")
-    print(f"Report file has been saved at 報告文件已保存至{output_txt_path}")
+    options = ScanOptions(search_apis, search_deps, tuple(excluded_dirs_api), tuple(excluded_dirs_deps), args.shard, args.dedup,
+                          pod_cache=args.pod_cache, mask_literals=args.mask_literals)
+    with Scanner(pod_cache_max_bytes=args.pod_cache_size * 1024 * 1024) as scanner:
+        for target, files, privacy_manifest in targets:
+            run_scan(scanner, args.directory, options._replace(only_files=files), download_privacy_info,
+                     args.partial_output, args.store, args.label, target, privacy_manifest)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,4 +1,6 @@
 import argparse
+import codecs
+import io
 import os
 import datetime
 import urllib.request
@@ -179,6 +181,68 @@ def process_dependency(name, url_info, base_dir="Deps_PrivacyInfos"):
             print(f"Downloaded PrivacyInfo.xcprivacy for {name} ({key}).")
 
 
+# 流式读取的缓冲区大小，以及编码检测最多读取的字节数
+# Buffer size for streaming reads, and the most bytes fed to the encoding detector
+READ_CHUNK_BYTES = 64 * 1024
+DETECT_MAX_BYTES = 256 * 1024
+
+
+def detect_encoding(f):
+    """
+    Detect the encoding of an open binary file by feeding chardet until it is confident or
+    DETECT_MAX_BYTES were read. Returns the encoding and the chunks read so far, which still need decoding.
+    逐块检测已打开二进制文件的编码，直到 chardet 确定或读满 DETECT_MAX_BYTES，返回编码以及已读取、待解码的数据块。
+    """
+    detector = chardet.UniversalDetector()
+    chunks = []
+    read_bytes = 0
+    while not detector.done and read_bytes < DETECT_MAX_BYTES:
+        chunk = f.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        read_bytes += len(chunk)
+        detector.feed(chunk)
+    detector.close()
+    encoding = detector.result.get('encoding')
+    # 只检测了开头时，纯 ASCII 的结果按 UTF-8 解码，以兼容文件后面出现的非 ASCII 字符
+    # ASCII is a subset of UTF-8; decode as UTF-8 in case non-ASCII text appears after the detected prefix
+    if encoding and encoding.lower() == 'ascii':
+        encoding = 'utf-8'
+    return encoding, chunks
+
+
+def iter_decoded_lines(file_path):
+    """
+    Yield the lines of a file in its detected encoding, one buffered read at a time.
+    Undecodable bytes are replaced, and newlines are translated like text mode does, so
+    line numbers match the UTF-8 script.
+    以检测到的编码逐块流式读取文件并逐行产出；无法解码的字节会被替换，换行符与文本模式相同，行号与 UTF-8 脚本一致。
+    """
+    with open(file_path, 'rb') as f:
+        encoding, chunks = detect_encoding(f)
+        if not encoding:
+            return
+        try:
+            decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors='replace'), translate=True)
+        except LookupError:
+            print(f"Error reading {file_path}: unknown encoding {encoding}")
+            return
+
+        pending = ''
+        while True:
+            chunk = chunks.pop(0) if chunks else f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            lines = (pending + decoder.decode(chunk)).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield pending
+
+
 def process_file(file_path, is_api_search, search_deps, found_attracking):
     """
     在指定目录中搜索文件，检查API使用和依赖
@@ -187,37 +251,7 @@ def process_file(file_path, is_api_search, search_deps, found_attracking):
     found_patterns = {}
     found_deps = set()
     if file_path.endswith(('.swift', '.m', '.h')):
-        # Detect the encoding of the file
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            detected_encoding = chardet.detect(raw_data).get('encoding')
-
-        # If the encoding was detected, proceed to read the file
-        if detected_encoding:
-            try:
-                with open(file_path, 'r', encoding=detected_encoding) as f:
-                    lines = f.readlines()
-                
-                # Convert lines to UTF-8
-                new_lines = []
-                for line in lines:
-                    try:
-                        # Try encoding with detected encoding and decoding to UTF-8
-                        new_line = line.encode(detected_encoding).decode('utf-8')
-                        new_lines.append(new_line)
-                    except UnicodeDecodeError:
-                        # If there's an error, replace problematic characters
-                        new_line = line.encode(detected_encoding, errors='replace').decode('utf-8')
-                        new_lines.append(new_line)
-
-                lines = new_lines
-            except UnicodeDecodeError as e:
-                print(f"Error reading {file_path} with detected encoding {detected_encoding}: {e}")
-                return found_patterns, found_deps, found_attracking
-        else:
-            return found_patterns, found_deps, found_attracking
-
-        for i, line in enumerate(lines, start=1):
+        for i, line in enumerate(iter_decoded_lines(file_path), start=1):
             if is_api_search:
                 for category, patterns in compiled_api_patterns.items():
                     for pattern in patterns: